@@ -2,15 +2,26 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from tkcalendar import DateEntry
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pymongo
-from bson import ObjectId
+import os
+import threading
+
+from queries import (CATEGORIES, build_query, patch_summary, row_matches, format_summary, format_categories,
+                     validate_expense, KeysetPager)
+from virtual_table import VirtualTable
+from worker import BackgroundExecutor
+from storage import DEFAULT_URL, open_storage
+from read_cache import QueryCache, cache_key
+
+# matplotlib (charts), NumPy (column_store), pymongo (mongo_storage, indexes),
+# openpyxl / pyarrow (exporters) and the importer are imported where they are
+# first used, mostly on worker threads, so the window appears before they load.
 
 # --------------------------
 # Config / Theme definitions
 # --------------------------
+SEARCH_DEBOUNCE_MS = 250  # typing pause before a search is sent
+EXTERNAL_POLL_MS = 500  # how often the Tk thread picks up writes the storage watcher saw
+
 LIGHT_THEME = {
     "bg": "#F7F9FB",
     "frame_bg": "#FFFFFF",
@@ -25,18 +36,26 @@ LIGHT_THEME = {
 # --------------------------
 class ExpenseTrackerApp:
     def __init__(self, root,
-                 mongo_uri="mongodb://localhost:27017/",
+                 mongo_uri=DEFAULT_URL,
                  db_name="expense_db",
-                 collection_name="expenses"):
+                 collection_name="expenses",
+                 storage=None,
+                 metrics=None,
+                 journal=None):
         self.root = root
         self.root.title("Expense Tracker")
         self.root.geometry("960x620")
         self.root.minsize(900, 560)
 
-        # MongoDB
-        self.client = pymongo.MongoClient(mongo_uri)
-        self.db = self.client[db_name]
-        self.collection = self.db[collection_name]
+        # Storage backend (MongoDB by default, see storage.open_storage). Unless one is
+        # passed in, it is opened by the first background job; see the `storage` property
+        # opt-in instrumentation (metrics.Metrics): storage calls, UI handlers, jobs and stalls
+        self.metrics = metrics
+        self._storage = self.instrument_storage(storage) if storage is not None else None
+        self.storage_error = None
+        self.storage_ready = threading.Event()
+        if storage is not None:
+            self.storage_ready.set()
 
         # State
         self.theme_vars = LIGHT_THEME
@@ -45,16 +64,81 @@ class ExpenseTrackerApp:
         self.category_var = tk.StringVar(value="Select Category")
         self.date_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-%d"))
         self.total_expenses = tk.DoubleVar(value=0.0)
+        self.summary_text = tk.StringVar()
+        self.category_text = tk.StringVar()
+        self.summary = None  # last aggregation result for the current filter
+        self.data_version = 0  # bumped on every write; keys the chart cache
 
         # Search/filter vars
         self.filter_from = tk.StringVar()
         self.filter_to = tk.StringVar()
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *a: self.schedule_search())
+        self.search_after = None
+        self.applied_range = ("", "")  # date range of the last Apply Filters, combined with the search
+        self.current_query = {}  # filter behind the rows currently shown
+        self.sort_field = "date"
+        self.sort_desc = False
+
+        # all storage calls run on this executor, results come back on the Tk thread
+        self.status_text = tk.StringVar()
+        self.worker = BackgroundExecutor(self.root, on_status=self.show_status, metrics=metrics)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.charts = None  # ChartsPanel, created on first "Show Graphs"
+        if storage is None:
+            self.worker.submit(lambda job: self.open_storage(mongo_uri, db_name, collection_name, journal))
+
+        # recently used filter/sort results, dropped by our writes and by the storage watcher
+        self.cache = QueryCache()
+        self.watch_stop = threading.Event()
+        self.external_change = threading.Event()  # set by the watcher, handled on the Tk thread
+        # every expense as NumPy columns when they fit (see column_store); None while unknown or too many
+        self.columns = None
+        self.columns_fit = None
+        self.columns_pending = False
+        self.columns_generation = 0  # bumped by writes a load in flight may have missed
+        threading.Thread(target=self.watch_storage, daemon=True).start()
+
+        if metrics is not None:
+            from metrics import UI_HANDLERS, StallMonitor, instrument_handlers
+            instrument_handlers(self, UI_HANDLERS, metrics)  # before build_ui binds them to widgets
+            self.stall_monitor = StallMonitor(self.root, metrics)
+            self.stall_monitor.start()
 
         # Setup style & UI
         self.setup_style()
         self.build_ui()
         self.apply_theme()  # apply colors
+        if metrics is not None:
+            instrument_handlers(self.table, ("render",), metrics)  # table redraws while scrolling
+        # idempotent; queued before the first load so it can use the indexes
+        self.worker.submit(lambda job: self.storage.ensure_schema())
         self.load_all_expenses()
+        self.external_after = self.root.after(EXTERNAL_POLL_MS, self.poll_external_changes)
+
+    @property
+    def storage(self):
+        # only used inside background jobs and the watcher thread: those submitted while the
+        # backend is still being opened wait for it here instead of on the Tk thread
+        self.storage_ready.wait()
+        if self._storage is None:
+            raise RuntimeError(f"Could not open storage: {self.storage_error}")
+        return self._storage
+
+    def open_storage(self, url, db_name, collection_name, journal=None):
+        try:
+            self._storage = self.instrument_storage(open_storage(url, db_name, collection_name, journal))
+        except Exception as e:
+            self.storage_error = e
+            raise
+        finally:
+            self.storage_ready.set()
+
+    def instrument_storage(self, storage):
+        if self.metrics is None:
+            return storage
+        from metrics import InstrumentedStorage
+        return InstrumentedStorage(storage, self.metrics)
 
     # --------------------------
     # Styling
@@ -84,6 +168,12 @@ class ExpenseTrackerApp:
         title = ttk.Label(topbar, text="Expense Tracker", style="Header.TLabel")
         title.pack(side="left") #Places the widget on the left side of the parent window/frame.
 
+        # Status bar (background work progress)
+        statusbar = ttk.Frame(root, padding=(12, 0, 12, 8))
+        statusbar.pack(side="bottom", fill="x")
+        ttk.Label(statusbar, textvariable=self.status_text, foreground=LIGHT_THEME["muted"]).pack(side="left")
+        self.cancel_btn = ttk.Button(statusbar, text="Cancel", command=self.cancel_loads)
+        self.progress = ttk.Progressbar(statusbar, mode="indeterminate", length=160)
 
         main_frame = ttk.Frame(root, padding=12)
         main_frame.pack(fill="both", expand=True) # expand controls WHETHER a widget receives extra space when the window grows.
@@ -108,9 +198,8 @@ class ExpenseTrackerApp:
         amt_entry.grid(row=3, column=0, pady=(0,8))
 
         ttk.Label(left_card, text="Category:").grid(row=4, column=0, sticky="w")
-        categories = ["Food", "Transport", "Housing", "Bills", "Clothing", "Health", "Education", "Entertainment", "Travel", "Other"]
         #ttk.Combobox : A dropdown list widget from the themed ttk module.
-        cat_combo = ttk.Combobox(left_card, textvariable=self.category_var, values=categories, state="readonly", width=26)
+        cat_combo = ttk.Combobox(left_card, textvariable=self.category_var, values=CATEGORIES, state="readonly", width=26)
         #state="readonly" : User must pick from the list (can't type custom text)
         cat_combo.grid(row=5, column=0, pady=(0,8))
 
@@ -144,6 +233,19 @@ class ExpenseTrackerApp:
         exp_xl_btn = tk.Button(extra_frame, text="📄 Export Excel", command=self.export_excel, bg="#F97316", fg="white", width=14)
         exp_xl_btn.grid(row=2, column=0, padx=4, pady=4)
 
+        exp_pq_btn = tk.Button(extra_frame, text="🧱 Export Parquet", command=self.export_parquet, bg="#0D9488", fg="white", width=14)
+        exp_pq_btn.grid(row=3, column=0, padx=4, pady=4)
+
+        diag_btn = tk.Button(extra_frame, text="🩺 Diagnostics", command=self.show_diagnostics, bg="#64748B", fg="white", width=14)
+        diag_btn.grid(row=4, column=0, padx=4, pady=4)
+
+        import_btn = tk.Button(extra_frame, text="📥 Import Statement", command=self.import_statement, bg="#2563EB", fg="white", width=14)
+        import_btn.grid(row=5, column=0, padx=4, pady=4)
+
+        if self.metrics is not None:
+            perf_btn = tk.Button(extra_frame, text="⏱ Performance", command=self.show_metrics, bg="#475569", fg="white", width=14)
+            perf_btn.grid(row=6, column=0, padx=4, pady=4)
+
         # Right: table + filters
         right_card = ttk.Frame(main_frame, style="Card.TFrame", padding=12)
         right_card.pack(side="left", fill="both", expand=True)
@@ -152,6 +254,9 @@ class ExpenseTrackerApp:
         filters = ttk.Frame(right_card)
         filters.pack(fill="x", pady=(0,8))
 
+        ttk.Label(filters, text="Search:").grid(row=0, column=0, sticky="w")
+        ttk.Entry(filters, textvariable=self.search_var, width=22).grid(row=1, column=0, columnspan=2, padx=(0,8))
+
         ttk.Label(filters, text="From:").grid(row=0, column=2, sticky="w")
         DateEntry(filters, textvariable=self.filter_from, width=14, date_pattern='yyyy-mm-dd').grid(row=1, column=2, padx=(0,8))
 
@@ -164,16 +269,17 @@ class ExpenseTrackerApp:
         clear_btn = ttk.Button(filters, text="Clear Filters", command=self.clear_filters)
         clear_btn.grid(row=1, column=5, padx=(8,0))
 
-        # Table
+        # Table (virtualized: only the visible rows live in the Treeview)
         columns = ("_id", "description", "amount", "category", "date")
-        self.tree = ttk.Treeview(right_card, columns=columns, show="headings", selectmode="extended")
+        self.table = VirtualTable(right_card, columns, self.row_values, loader=self.worker.submit)
+        self.tree = self.table.tree
         for col in columns:
             self.tree.heading(col, text=col.capitalize(), command=lambda c=col: self.sort_by_column(c, False))
             if col == "_id":
                 self.tree.column(col, width=0, stretch=False, anchor="center")
             else:
                 self.tree.column(col, anchor="center", width=140)
-        self.tree.pack(fill="both", expand=True, pady=(6, 0))
+        self.table.pack(fill="both", expand=True, pady=(6, 0))
 
         # alternating row tags
         self.tree.tag_configure("odd", background="#FBFBFB")
@@ -187,6 +293,8 @@ class ExpenseTrackerApp:
         summary_frame.pack(fill="x", pady=(8,0))
         ttk.Label(summary_frame, text="Total:", font=("Segoe UI", 11, "bold")).pack(side="left")
         ttk.Label(summary_frame, textvariable=self.total_expenses, font=("Segoe UI", 11, "bold")).pack(side="left", padx=(6,0))
+        ttk.Label(summary_frame, textvariable=self.summary_text, foreground=LIGHT_THEME["muted"]).pack(side="left", padx=(16,0))
+        ttk.Label(right_card, textvariable=self.category_text, foreground=LIGHT_THEME["muted"]).pack(fill="x", pady=(2,0))
 
     # --------------------------
     # Theme handling
@@ -211,6 +319,72 @@ class ExpenseTrackerApp:
         style.configure("Treeview", background=frame_bg, fieldbackground=frame_bg, foreground=text)
         style.configure("Treeview.Heading", background=frame_bg, foreground=text)
 
+    # --------------------------
+    # Background work
+    # --------------------------
+    def show_status(self, pending, fraction):
+        if not pending:
+            self.status_text.set("")
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.cancel_btn.pack_forget()
+            return
+        self.status_text.set("Working…" if pending == 1 else f"Working… ({pending} tasks)")
+        if not self.progress.winfo_ismapped():
+            self.cancel_btn.pack(side="right")
+            self.progress.pack(side="right", padx=(0, 8))
+        if fraction is None:
+            if str(self.progress.cget("mode")) != "indeterminate":
+                self.progress.configure(mode="indeterminate", value=0)
+            self.progress.start(15)
+        else:
+            self.progress.stop()
+            self.progress.configure(mode="determinate", maximum=1.0, value=fraction)
+
+    def cancel_loads(self):
+        # reads only; writes already sent are allowed to finish
+        for channel in ("load", "page", "summary", "export", "graphs"):
+            self.worker.cancel(channel)
+
+    def watch_storage(self):
+        # runs on its own thread; other clients' writes only reach the cache through here
+        def changed(row):
+            # our own writes are not reported (see StorageBackend.watch); the cache has its own lock,
+            # everything else is left to the Tk thread
+            self.cache.invalidate(None if row is None else [row])
+            self.external_change.set()
+
+        try:
+            self.storage.watch(changed, self.watch_stop)
+        except RuntimeError:
+            pass  # storage never opened; the error was already shown by its job
+        finally:
+            if not self.watch_stop.is_set():
+                self.cache.disable()  # cannot see other writers any more, so stop serving from memory
+
+    def apply_external_changes(self):
+        # Tk thread: app state the watcher thread must not change itself
+        if self.external_change.is_set():
+            self.external_change.clear()
+            self.data_version += 1  # other clients' writes go stale in the chart cache too
+            # the column store cannot apply someone else's write; drop it and reload it lazily
+            self.columns_generation += 1
+            self.columns = self.columns_fit = None
+
+    def poll_external_changes(self):
+        self.apply_external_changes()
+        self.external_after = self.root.after(EXTERNAL_POLL_MS, self.poll_external_changes)
+
+    def on_close(self):
+        if self.metrics is not None:
+            self.stall_monitor.stop()
+        self.watch_stop.set()
+        self.root.after_cancel(self.external_after)
+        self.worker.shutdown()
+        if self._storage is not None:
+            self._storage.close()
+        self.root.destroy()
+
 
 
 
@@ -218,24 +392,8 @@ class ExpenseTrackerApp:
     # Data operations
     # --------------------------
     def validate_inputs(self, desc, amount_text, category, date_str):
-        # inline minimal validation returns (ok, message)
-        if not desc:
-            return False, "Description required."
-        if not amount_text:
-            return False, "Amount required."
-        try:
-            amt = float(amount_text)
-            if amt <= 0:
-                return False, "Amount must be > 0."
-        except ValueError:
-            return False, "Amount must be a number."
-        if category not in ["Food", "Transport", "Housing", "Bills", "Clothing", "Health", "Education", "Entertainment", "Travel", "Other"]:
-            return False, "Please select a category."
-        try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-        except ValueError:
-            return False, "Date must be YYYY-MM-DD."
-        return True, ""
+        # returns (ok, message); the importer applies the same rules to every file row
+        return validate_expense(desc, amount_text, category, date_str)
 
     def add_expense(self):
         #.get() reads the current string value of that StringVar.
@@ -253,118 +411,208 @@ class ExpenseTrackerApp:
 
         amt = float(amt_text)
         rec = {"description": desc, "amount": amt, "category": cat, "date": date_str, "created_at": datetime.utcnow()}
-        res = self.collection.insert_one(rec)
-
-        # insert into tree (show _id as string)
-        _id_str = str(res.inserted_id)
-        idx = len(self.tree.get_children())
-        tag = "even" if idx % 2 == 0 else "odd"
-        self.tree.insert("", "end", values=(_id_str, desc, f"{amt:.2f}", cat, date_str), tags=(tag,))
-        self.total_expenses.set(self.total_expenses.get() + amt)
 
-        # clear inputs
-        self.description_var.set("")
-        self.amount_var.set("")
-        self.category_var.set("Select Category")
-        self.date_var.set(datetime.now().strftime("%Y-%m-%d"))
+        def added(res):
+            self.data_version += 1
+            self.cache.invalidate([rec])
+            self.mirror_write(lambda cols: cols.append([rec]))
+            # the new row lands at its sorted position; rebuild the window around the current offset
+            self.reload_table(keep_offset=True)
+
+            # clear inputs
+            self.description_var.set("")
+            self.amount_var.set("")
+            self.category_var.set("Select Category")
+            self.date_var.set(datetime.now().strftime("%Y-%m-%d"))
+
+        self.worker.submit(lambda job: self.storage.insert(rec), on_done=added)
+
+    @staticmethod
+    def row_values(r):
+        # tree columns for one document (show _id as string)
+        amt = float(r.get("amount", 0.0))
+        return (str(r.get("_id")), r.get("description", ""), f"{amt:.2f}", r.get("category", ""), r.get("date", ""))
+
+    def reload_table(self, keep_offset=False):
+        # pages are fetched lazily by the table as it scrolls; only the count, the first
+        # window and the totals are loaded up front, off the Tk thread. A newer load
+        # (e.g. another filter click) cancels this one.
+        query, sort_field, sort_desc = self.current_query, self.sort_field, self.sort_desc
+        start, n = self.table.window() if keep_offset else (0, self.table.visible + self.table.margin)
+        max_rows = self.table.visible + 2 * self.table.margin + 200
+        key = cache_key(query, sort_field, sort_desc)
+        generation = self.cache.generation
+
+        self.apply_external_changes()
+        columns = self.columns
+        if columns is not None and columns.covers(query):
+            # every expense is in memory: mask + argsort the arrays, no round-trip
+            self.worker.cancel("load")
+            self.worker.cancel("summary")
+            from column_store import ArrayPager
+            self.show_rows(ArrayPager(columns, query, sort_field, sort_desc), columns.summarize(query), keep_offset)
+            return
+        if columns is None and self.columns_fit is not False and not self.columns_pending:
+            self.load_columns()
+
+        def load(job):
+            pager = KeysetPager(self.storage, query, sort_field, sort_desc, max_rows=max_rows)
+            job.check()
+            pager.get(start, n)
+            job.check()
+            # totals come from a server-side $group, never from the rows on screen
+            return pager, self.storage.summarize(query)
+
+        def loaded(res):
+            pager, summary = res
+            self.show_rows(pager, summary, keep_offset)
+            self.cache.put(key, pager, summary, generation)
+
+        self.worker.cancel("summary")
+        hit = self.cache.get(key)
+        if hit is not None:
+            # served from memory; rows outside the cached window are fetched as the table scrolls
+            self.worker.cancel("load")
+            loaded(hit)
+            return
+        self.worker.submit(load, on_done=loaded, channel="load")
+
+    def show_rows(self, pager, summary, keep_offset):
+        self.worker.cancel("page")
+        self.table.set_pager(pager, keep_offset=keep_offset)
+        self.show_summary(summary)
+
+    def load_columns(self):
+        # one background read of every expense when they fit in memory; later filter and sort
+        # changes are then served from the arrays
+        generation = self.columns_generation
+        self.columns_pending = True
+
+        def load(job):
+            from column_store import STORE_LIMIT, ExpenseColumns  # NumPy loads here, off the Tk thread
+            if self.storage.count({}, limit=STORE_LIMIT + 1) > STORE_LIMIT:
+                return None
+            return ExpenseColumns.load(self.storage, check=job.check)
+
+        def loaded(cols):
+            self.columns_pending = False
+            if generation != self.columns_generation:
+                return  # a write landed while loading; load again on next use
+            self.columns, self.columns_fit = cols, cols is not None
+
+        def failed(exc):
+            self.columns_pending = False
+
+        self.worker.submit(load, on_done=loaded, on_error=failed, channel="columns")
+
+    def mirror_write(self, apply):
+        # keep the column store in step with our own write; a load still in flight may predate it
+        columns = self.columns
+        if columns is not None:
+            apply(columns)
+        else:
+            self.columns_generation += 1
+
+    def refresh_summary(self):
+        query = self.current_query
+        self.worker.submit(lambda job: self.storage.summarize(query), on_done=self.show_summary, channel="summary")
+
+    def show_summary(self, summary):
+        self.summary = summary
+        self.total_expenses.set(round(summary["total"], 2))
+        self.summary_text.set(format_summary(summary))
+        self.category_text.set(format_categories(summary))
 
     def load_all_expenses(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        total = 0.0
-        recs = list(self.collection.find().sort("date", pymongo.ASCENDING))
-        for i, r in enumerate(recs):
-            _id_str = str(r.get("_id"))
-            desc = r.get("description", "")
-            amt = float(r.get("amount", 0.0))
-            cat = r.get("category", "")
-            date = r.get("date", "")
-            tag = "even" if i % 2 == 0 else "odd"
-            self.tree.insert("", "end", values=(_id_str, desc, f"{amt:.2f}", cat, date), tags=(tag,))
-            total += amt
-        self.total_expenses.set(total)
+        self.current_query = {}
+        self.reload_table()
 
     def apply_filters(self):
         date_from = self.filter_from.get().strip()
         date_to = self.filter_to.get().strip()
 
-        # Build query
-        query = {}
+        # Validate
         if date_from:
             try:
                 # module datetime.
                 datetime.strptime(date_from, "%Y-%m-%d") # strptime : string representation of a date into a datetime.datetime object
-                query["date"] = query.get("date", {})
-                query["date"]["$gte"] = date_from
             except ValueError:
                 messagebox.showwarning("Filter error", "From date must be YYYY-MM-DD")
                 return
         if date_to:
             try:
                 datetime.strptime(date_to, "%Y-%m-%d")
-                query["date"] = query.get("date", {})
-                query["date"]["$lte"] = date_to
             except ValueError:
                 messagebox.showwarning("Filter error", "To date must be YYYY-MM-DD")
                 return
-                
+
         #query = {"date": {"$gte": start, "$lte": end}}
-        # find
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        total = 0.0
-        recs = list(self.collection.find(query).sort("date", pymongo.ASCENDING))
-        #.sort("date", pymongo.ASCENDING) tells the cursor to sort the matched documents by the "date" field in ascending order.
-
-        for i, r in enumerate(recs):
-            _id_str = str(r.get("_id"))
-            desc = r.get("description", "")
-            amt = float(r.get("amount", 0.0))
-            cat = r.get("category", "")
-            date = r.get("date", "")
-            tag = "even" if i % 2 == 0 else "odd"
-            self.tree.insert("", "end", values=(_id_str, desc, f"{amt:.2f}", cat, date), tags=(tag,))
-            total += amt
-        self.total_expenses.set(total)
+        self.applied_range = (date_from, date_to)
+        self.current_query = build_query(date_from, date_to, self.search_var.get())
+        self.reload_table()
 
     def clear_filters(self):
         self.filter_from.set("")
         self.filter_to.set("")
+        self.applied_range = ("", "")
+        self.search_var.set("")
         self.load_all_expenses()
 
+    def schedule_search(self):
+        # debounced: only the last keystroke of a burst sends a query
+        if self.search_after is not None:
+            self.root.after_cancel(self.search_after)
+        self.search_after = self.root.after(SEARCH_DEBOUNCE_MS, self.run_search)
+
+    def run_search(self):
+        self.search_after = None
+        query = build_query(*self.applied_range, self.search_var.get())
+        if query == self.current_query:
+            return  # e.g. a one-letter word, which is not searched
+        self.current_query = query
+        # runs on the "load" channel, so a newer search cancels this one
+        self.reload_table()
+
+    def selection_target(self):
+        # (ids, query) for the selected rows; Ctrl+A selects the whole filter, which is sent as the query itself
+        if self.table.all_selected:
+            return None, dict(self.table.pager.query)
+        return [r["_id"] for r in self.table.selection()], None
+
     def delete_selected(self):
-        selected = self.tree.selection()
-        if not selected:
+        count = self.table.selection_count()
+        if not count:
             messagebox.showinfo("Selection", "No expense selected.")
             return
-        if not messagebox.askyesno("Confirm", f"Delete {len(selected)} selected item(s)?"):
+        if not messagebox.askyesno("Confirm", f"Delete {count} selected item(s)?"):
             return
-        for item in selected:
-            vals = self.tree.item(item, "values")
-            _id = vals[0]
-            try:
-                obj_id = ObjectId(_id)
-            except Exception:
-                continue
-            amount = float(vals[2])
-            self.collection.delete_one({"_id": obj_id})
-            self.total_expenses.set(self.total_expenses.get() - amount)
-            self.tree.delete(item)
+        ids, query = self.selection_target()
+        rows = None if query is not None else self.table.selection()
+        self.table.clear_selection()
+        # one bulk round-trip, then one reload for the table and the totals
+        def deleted(n):
+            self.data_version += 1
+            self.cache.invalidate(rows)
+            self.mirror_write(lambda cols: cols.remove(ids, query))
+            self.reload_table(keep_offset=True)
+
+        self.worker.submit(lambda job: self.storage.delete(ids, query), on_done=deleted)
 
     def edit_selected(self):
-        selected = self.tree.selection()
-        if not selected:
+        count = self.table.selection_count()
+        if not count:
             messagebox.showinfo("Edit", "Select a single item to edit (double click row or select then click Edit).")
             return
-        if len(selected) > 1:
-            messagebox.showinfo("Edit", "Please select only one item to edit at a time.")
+        if count > 1:
+            self.open_bulk_edit_dialog(count)
             return
 
-        item = selected[0]
-        vals = self.tree.item(item, "values")
-        _id = vals[0]
-        rec = self.collection.find_one({"_id": ObjectId(_id)})
+        selected = self.table.selection()
+        _id = selected[0]["_id"]
+        self.worker.submit(lambda job: self.storage.get(_id),
+                           on_done=lambda rec: self.open_edit_dialog(_id, rec))
+
+    def open_edit_dialog(self, _id, rec):
         if not rec:
             messagebox.showerror("Edit", "Record not found.")
             return
@@ -387,7 +635,7 @@ class ExpenseTrackerApp:
 
         tk.Label(dlg, text="Category:").pack(anchor="w", padx=12)
         cat_var = tk.StringVar(value=rec.get("category", "Other"))
-        ttk.Combobox(dlg, textvariable=cat_var, values=["Food","Transport","Housing","Bills","Clothing","Health","Education","Entertainment","Travel","Other"], state="readonly", width=36).pack(padx=12, pady=(0,8))
+        ttk.Combobox(dlg, textvariable=cat_var, values=CATEGORIES, state="readonly", width=36).pack(padx=12, pady=(0,8))
 
         tk.Label(dlg, text="Date:").pack(anchor="w", padx=12)
         date_var = tk.StringVar(value=rec.get("date", datetime.now().strftime("%Y-%m-%d")))
@@ -403,27 +651,110 @@ class ExpenseTrackerApp:
                 messagebox.showwarning("Validation", msg)
                 return
             amt_new_f = float(amt_new)
+            changes = {"description": desc_new, "amount": amt_new_f, "category": cat_new, "date": date_new}
+
+            def saved(res):
+                self.cache.invalidate([rec, {**rec, **changes}])
+                self.mirror_write(lambda cols: cols.update({**rec, **changes}))
+                self.apply_edit(rec, {**rec, **changes})
+                dlg.destroy()
+
             # update db
-            self.collection.update_one({"_id": ObjectId(_id)}, {"$set": {"description": desc_new, "amount": amt_new_f, "category": cat_new, "date": date_new}})
-            # refresh table (simplest: reload filters or all)
-            self.load_all_expenses()
-            dlg.destroy()
+            self.worker.submit(lambda job: self.storage.update(_id, rec, changes), on_done=saved)
 
         ttk.Button(dlg, text="Save", command=save_edits).pack(pady=12)
 
+    def apply_edit(self, old, new):
+        # patch the edited row in place instead of reloading the table
+        self.data_version += 1
+        pager = self.table.pager
+        # ArrayPager (column store): re-select from the arrays rather than patching
+        if pager is None or self.summary is None or not isinstance(pager, KeysetPager):
+            self.reload_table(keep_offset=True)
+            return
+        matches = row_matches(pager.query, new)
+        if matches is None:
+            self.reload_table(keep_offset=True)
+            return
+        if not matches:
+            # edited out of the current filter: one row fewer, refetch the visible window
+            pager.invalidate(count_delta=-1)
+            self.table.selected.pop(str(new["_id"]), None)
+            self.table.refresh()
+        elif old.get(pager.sort_field) != new.get(pager.sort_field):
+            # sort key changed: the row moves, so the window around the offset is refetched
+            pager.invalidate()
+            self.table.refresh()
+        else:
+            pager.patch(new)
+            self.table.update_row(new)
+
+        exact = patch_summary(self.summary, old, new if matches else None)
+        self.show_summary(self.summary)
+        if not exact:
+            self.refresh_summary()
+
+    def open_bulk_edit_dialog(self, count):
+        ids, query = self.selection_target()
+        rows = None if query is not None else self.table.selection()
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Bulk Edit")
+        dlg.geometry("360x240")
+        dlg.transient(self.root)
+        dlg.grab_set()
+
+        tk.Label(dlg, text=f"Apply to {count} selected item(s):").pack(anchor="w", padx=12, pady=(12,8))
+
+        set_cat = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dlg, text="Set category:", variable=set_cat).pack(anchor="w", padx=12)
+        cat_var = tk.StringVar(value="Other")
+        ttk.Combobox(dlg, textvariable=cat_var, values=CATEGORIES, state="readonly", width=36).pack(padx=12, pady=(0,8))
+
+        set_date = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dlg, text="Set date:", variable=set_date).pack(anchor="w", padx=12)
+        date_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-%d"))
+        DateEntry(dlg, textvariable=date_var, width=36, date_pattern='yyyy-mm-dd').pack(padx=12, pady=(0,8))
+
+        def save_bulk():
+            changes = {}
+            if set_cat.get():
+                changes["category"] = cat_var.get()
+            if set_date.get():
+                date_new = date_var.get().strip()
+                try:
+                    datetime.strptime(date_new, "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showwarning("Validation", "Date must be YYYY-MM-DD.")
+                    return
+                changes["date"] = date_new
+            if not changes:
+                messagebox.showwarning("Validation", "Tick the fields to change.")
+                return
+
+            def saved(n):
+                self.data_version += 1
+                self.cache.invalidate(None if rows is None else rows + [{**r, **changes} for r in rows])
+                self.mirror_write(lambda cols: cols.assign(changes, ids, query))
+                self.table.clear_selection()
+                self.reload_table(keep_offset=True)
+                dlg.destroy()
+
+            # a single bulk write for the whole selection
+            self.worker.submit(lambda job: self.storage.update_many(changes, ids, query), on_done=saved)
+
+        ttk.Button(dlg, text="Apply", command=save_bulk).pack(pady=12)
+
     # --------------------------
     # Sorting helper
     # --------------------------
     def sort_by_column(self, col, descending):
-        data = [(self.tree.set(child, col), child) for child in self.tree.get_children('')]
-        # try numeric sort
-        try:
-            data = [(float(v), k) for (v, k) in data]
-        except Exception:
-            data = [(v.lower(), k) for (v, k) in data]
-        data.sort(reverse=descending)
-        for index, (val, k) in enumerate(data):
-            self.tree.move(k, '', index)
+        if col == "_id":
+            return
+        # the table only holds the visible rows, so the sort happens in the query
+        self.sort_field = col
+        self.sort_desc = descending
+        self.reload_table()
         # reverse sort next time
         self.tree.heading(col, command=lambda c=col: self.sort_by_column(c, not descending))
 
@@ -431,81 +762,208 @@ class ExpenseTrackerApp:
     # Export / Graph
     # --------------------------
     def export_csv(self):
-        recs = list(self.collection.find({}, {"_id":0})) # it tells MongoDB to return all fields except the _id field
-        if not recs:
-            messagebox.showinfo("Export", "No records to export.")
-            return
-        df = pd.DataFrame(recs)
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files","*.csv")])
         # asksaveasfilename() displays a Save As file-dialog window that asks the user to select (or type) 
         #a file name and location to save a file. It then returns the selected file path as a string.
         if path:
-            df.to_csv(path, index=False)
-            messagebox.showinfo("Export", f"Exported to {path}")
+            self.run_export(path, "export_csv")
 
     def export_excel(self):
-        recs = list(self.collection.find({}, {"_id":0}))
-        if not recs:
-            messagebox.showinfo("Export", "No records to export.")
-            return
-        df = pd.DataFrame(recs)
         path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files","*.xlsx")])
         if path:
-            df.to_excel(path, index=False, engine="openpyxl")
-            messagebox.showinfo("Export", f"Exported to {path}")
+            self.run_export(path, "export_xlsx")
 
-    def show_graphs(self):
-        recs = list(self.collection.find({}, {"_id":0}))
-        if not recs:
-            messagebox.showinfo("Graphs", "No data to graph.")
-            return
-        df = pd.DataFrame(recs)
-        # Ensure date column present
-        if "date" not in df.columns:
-            messagebox.showinfo("Graphs", "No date data available.")
+    def export_parquet(self):
+        # the chosen name becomes a folder: <name>/year=YYYY/month=MM/part-0.parquet
+        path = filedialog.asksaveasfilename(title="Export Parquet dataset to folder", initialfile="expenses_parquet")
+        if path:
+            self.run_export(path, "export_columnar")
+
+    def run_export(self, path, exporter):
+        # streams the rows of the applied filter to disk batch by batch;
+        # `exporter` names a function of exporters.py, imported on the worker
+        query = self.current_query
+
+        def export(job):
+            import exporters
+            if not self.storage.count(query, limit=1):
+                return 0
+            return getattr(exporters, exporter)(self.storage, path, query, progress=job.progress, check=job.check)
+
+        def exported(n):
+            if not n:
+                messagebox.showinfo("Export", "No records to export.")
+            else:
+                messagebox.showinfo("Export", f"Exported to {path}")
+
+        self.worker.submit(export, on_done=exported, channel="export")
+
+    # --------------------------
+    # Import
+    # --------------------------
+    def import_statement(self):
+        path = filedialog.askopenfilename(title="Import bank statement",
+                                          filetypes=[("Statements", "*.csv *.ofx *.qfx"), ("All files", "*.*")])
+        if not path:
             return
 
-        # create dialog
+        from importer import format_result, import_file
+
+        def imported(result):
+            if result["inserted"]:
+                # a bulk write touching any date: start the caches and the column store over
+                self.data_version += 1
+                self.cache.invalidate()
+                self.columns_generation += 1
+                self.columns = self.columns_fit = None
+                self.reload_table(keep_offset=True)
+            show = messagebox.showwarning if result["error_count"] else messagebox.showinfo
+            show("Import", format_result(result))
+
+        # streamed and written in batches; rows failing validation are reported, not imported
+        self.worker.submit(lambda job: import_file(self.storage, path, progress=job.progress, check=job.check),
+                           on_done=imported, channel="import")
+
+    # --------------------------
+    # Diagnostics
+    # --------------------------
+    def show_diagnostics(self):
+        # explain() every query shape the app issues and report which ones miss an index
+        self.worker.submit(lambda job: self.storage.explain_report(), on_done=self.open_diagnostics)
+
+    def open_diagnostics(self, report):
+        from indexes import format_report  # already loaded by explain_report
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Diagnostics")
+        dlg.geometry("620x380")
+        dlg.transient(self.root)
+
+        slow = sum(1 for r in report if not r["ok"])
+        summary = "All query shapes use an index." if not slow else f"{slow} query shape(s) scan the collection or sort in memory."
+        tk.Label(dlg, text=summary, anchor="w").pack(fill="x", padx=12, pady=(12,6))
+        text = tk.Text(dlg, font=("Consolas", 10), height=16)
+        text.insert("1.0", format_report(report))
+        text.configure(state="disabled")
+        text.pack(fill="both", expand=True, padx=12, pady=(0,6))
+
+        # rollup maintenance (charts read the day x category rollups)
+        rollup_frame = ttk.Frame(dlg)
+        rollup_frame.pack(fill="x", padx=12, pady=(0,12))
+        ttk.Button(rollup_frame, text="Verify Rollups", command=self.verify_rollups).pack(side="left")
+        ttk.Button(rollup_frame, text="Rebuild Rollups", command=self.rebuild_rollups).pack(side="left", padx=(8,0))
+
+    # --------------------------
+    # Performance (opt-in, see metrics.py)
+    # --------------------------
+    def show_metrics(self):
+        from metrics import ProfileCapture
+
         dlg = tk.Toplevel(self.root)
-        dlg.title("Expense Charts")
-        dlg.geometry("900x600")
+        dlg.title("Performance")
+        dlg.geometry("720x460")
         dlg.transient(self.root)
 
-        # pie by category
-        fig1 = plt.Figure(figsize=(4,4))
-        ax1 = fig1.add_subplot(111) 
-        # equivalent to: fig.add_subplot(1, 1, 1) (number of rows in the subplot grid, number of columns in the subplot grid, index of the subplot)
-        cat_sum = df.groupby("category")["amount"].sum() #perform a group-by and aggregation
-        ax1.pie(cat_sum, labels=cat_sum.index, autopct='%1.1f%%', startangle=90) #Rotates the start of the pie so that the first wedge starts at 90°
-        ax1.set_title("Expenses by Category")
-
-        canvas1 = FigureCanvasTkAgg(fig1, master=dlg)
-        # FigureCanvasTkAgg is a class in matplotlib.backends.backend_tkagg 
-        # that creates a Tkinter-compatible canvas widget from a matplotlib Figure object.
-        canvas1.get_tk_widget().pack(side="left", fill="both", expand=True, padx=6, pady=6)
-        canvas1.draw()
-
-        # bar by date
-        fig2 = plt.Figure(figsize=(5,4))
-        ax2 = fig2.add_subplot(111)
-        date_sum = df.groupby("date")["amount"].sum()
-        date_sum.plot(kind="bar", ax=ax2)
-        ax2.set_title("Expenses by Date")
-        ax2.set_ylabel("Amount (DZD)")
-        ax2.set_xlabel("Date")
-        for label in ax2.get_xticklabels():
-            label.set_rotation(45)
-
-        canvas2 = FigureCanvasTkAgg(fig2, master=dlg)
-        canvas2.get_tk_widget().pack(side="left", fill="both", expand=True, padx=6, pady=6)
-        canvas2.draw()
+        text = tk.Text(dlg, font=("Consolas", 10), height=20, wrap="none")
+        status = tk.StringVar(value="Latency of storage calls, UI handlers and background jobs since start.")
+
+        def refresh():
+            text.configure(state="normal")
+            text.delete("1.0", "end")
+            text.insert("1.0", self.metrics.format_report())
+            text.configure(state="disabled")
+
+        def auto_refresh():
+            if dlg.winfo_exists():
+                refresh()
+                dlg.after(1000, auto_refresh)
+
+        def reset():
+            self.metrics.reset()
+            refresh()
+
+        def save():
+            path = filedialog.asksaveasfilename(parent=dlg, defaultextension=".json", initialfile="expense_tracker_metrics.json",
+                                                filetypes=[("JSON files", "*.json")])
+            if path:
+                self.metrics.dump(path)
+                status.set(f"Saved to {path}")
+
+        def profile_next():
+            # the next handler call (and the jobs it submits) runs under cProfile
+            self.metrics.capture = ProfileCapture(self.show_profile)
+            status.set("Profiling the next action…")
+
+        tk.Label(dlg, textvariable=status, anchor="w").pack(fill="x", padx=12, pady=(12,6))
+        text.pack(fill="both", expand=True, padx=12, pady=(0,6))
+        buttons = ttk.Frame(dlg)
+        buttons.pack(fill="x", padx=12, pady=(0,12))
+        ttk.Button(buttons, text="Reset", command=reset).pack(side="left")
+        ttk.Button(buttons, text="Save to File…", command=save).pack(side="left", padx=(8,0))
+        ttk.Button(buttons, text="Profile Next Action", command=profile_next).pack(side="left", padx=(8,0))
+        auto_refresh()
+
+    def show_profile(self, action, path, report):
+        dlg = tk.Toplevel(self.root)
+        dlg.title(f"Profile: {action}")
+        dlg.geometry("900x500")
+        saved = f"Saved to {path} (open with pstats or snakeviz)" if path else "No profile file written"
+        tk.Label(dlg, text=saved, anchor="w").pack(fill="x", padx=12, pady=(12,6))
+        text = tk.Text(dlg, font=("Consolas", 9), wrap="none")
+        text.insert("1.0", report)
+        text.configure(state="disabled")
+        text.pack(fill="both", expand=True, padx=12, pady=(0,12))
+
+    def verify_rollups(self):
+        def verified(problems):
+            if not problems:
+                messagebox.showinfo("Rollups", "Rollups match the expenses.")
+            else:
+                shown = "\n".join(problems[:15])
+                more = f"\n… and {len(problems) - 15} more" if len(problems) > 15 else ""
+                messagebox.showwarning("Rollups", f"{len(problems)} mismatch(es):\n{shown}{more}")
+
+        self.worker.submit(lambda job: self.storage.verify_rollups(), on_done=verified)
+
+    def rebuild_rollups(self):
+        self.worker.submit(lambda job: self.storage.rebuild_rollups(),
+                           on_done=lambda res: messagebox.showinfo("Rollups", "Rollups rebuilt."))
+
+    def show_graphs(self):
+        # charts read the day x category rollups for the applied date filter, not the expenses;
+        # unchanged data for the same filter is served from the chart cache without a query
+        query = self.current_query
+        self.apply_external_changes()
+        key = (self.data_version, repr(sorted(query.items())))
+        if self.charts is None:
+            from charts import ChartsPanel  # matplotlib is only loaded once charts are asked for
+            self.charts = ChartsPanel(self.root)
+        if self.charts.has(key):
+            self.charts.show(key)
+            return
+
+        def loaded(recs):
+            if not recs:
+                messagebox.showinfo("Graphs", "No data to graph.")
+                return
+            self.charts.show(key, recs)
+
+        self.worker.submit(lambda job: self.storage.read_rollups(query), on_done=loaded, channel="graphs")
 
     # --------------------------
     # Run app
     # --------------------------
 def main():
     root = tk.Tk()
-    app = ExpenseTrackerApp(root)
+    metrics = None
+    if os.environ.get("EXPENSE_TRACKER_METRICS"):
+        # opt-in latency instrumentation and the Performance window
+        from metrics import Metrics
+        metrics = Metrics()
+    # e.g. EXPENSE_TRACKER_STORAGE=sqlite:///expenses.db for the embedded backend;
+    # EXPENSE_TRACKER_JOURNAL=expense_journal.db journals MongoDB writes locally first (see journal.py)
+    app = ExpenseTrackerApp(root, mongo_uri=os.environ.get("EXPENSE_TRACKER_STORAGE", DEFAULT_URL), metrics=metrics,
+                            journal=os.environ.get("EXPENSE_TRACKER_JOURNAL"))
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,433 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from queries import KeysetPager, build_query
+from storage import open_storage
+
+# --------------------------
+# Benchmark suite
+# --------------------------
+# Seeds synthetic expenses (10k / 100k / 1M by default) into a throwaway
+# store and times the operations behind the app's handlers: first load,
+# filters, sorts, search, the column store, exports, the chart query and
+# bulk deletes / edits, plus Treeview and chart rendering when Tk has a
+# display (run under `xvfb-run` on a headless machine). Results are written
+# as JSON; `--compare` checks them against an earlier run:
+#
+#   python benchmarks.py --sizes 10000,100000 --out before.json
+#   python benchmarks.py --sizes 10000,100000 --out after.json --compare before.json
+
+SIZES = (10_000, 100_000, 1_000_000)
+BACKENDS = ("sqlite", "mongo", "mongomock")
+SEED = 1234
+REPEAT = 3
+SEED_BATCH = 10_000
+PAGE_ROWS = 70  # visible rows + margin, what the table asks for on a reload
+REGRESSION = 1.25  # --compare flags operations at least this much slower
+NOISE_FLOOR = 0.005  # ... unless they take less than this many seconds (timer / scheduler noise)
+
+# category mix and per-category log-normal amounts (mu, sigma) loosely shaped like card spending
+CATEGORY_WEIGHTS = {"Food": 30, "Transport": 15, "Housing": 4, "Bills": 8, "Clothing": 6, "Health": 5,
+                    "Education": 2, "Entertainment": 12, "Travel": 3, "Other": 15}
+CATEGORY_AMOUNTS = {"Food": (2.6, 0.7), "Transport": (2.2, 0.6), "Housing": (6.5, 0.3), "Bills": (4.2, 0.5),
+                    "Clothing": (3.6, 0.7), "Health": (3.4, 0.9), "Education": (4.5, 0.8),
+                    "Entertainment": (3.0, 0.8), "Travel": (5.2, 0.9), "Other": (3.0, 1.0)}
+MERCHANTS = {
+    "Food": ["Grocery store", "Coffee shop", "Bakery", "Pizza place", "Supermarket", "Lunch canteen"],
+    "Transport": ["Bus ticket", "Metro card", "Taxi ride", "Fuel station", "Parking"],
+    "Housing": ["Monthly rent", "Home repairs", "Furniture shop"],
+    "Bills": ["Electricity bill", "Water bill", "Internet subscription", "Phone plan"],
+    "Clothing": ["Shoe store", "Clothing market", "Tailor"],
+    "Health": ["Pharmacy", "Doctor visit", "Dentist", "Gym membership"],
+    "Education": ["Bookshop", "Online course", "School supplies"],
+    "Entertainment": ["Cinema tickets", "Streaming service", "Concert", "Video games"],
+    "Travel": ["Flight tickets", "Hotel booking", "Train tickets"],
+    "Other": ["Gift", "Charity donation", "Hardware store", "Post office"],
+}
+HISTORY_DAYS = 3 * 365
+
+
+def synthetic_batches(n, seed=SEED, end=date(2025, 12, 31), batch_size=SEED_BATCH):
+    """Yield `n` reproducible expense dicts in batches.
+
+    Spending is denser on weekends and in December, and the newest year has
+    more rows than the oldest, so date filters see uneven selectivity.
+    """
+    rng = random.Random(seed)
+    cats = list(CATEGORY_WEIGHTS)
+    cat_cum = _cumulative(CATEGORY_WEIGHTS[c] for c in cats)
+    first = end - timedelta(days=HISTORY_DAYS - 1)
+    days = [first + timedelta(days=i) for i in range(HISTORY_DAYS)]
+    day_cum = _cumulative((1.6 if d.weekday() >= 5 else 1.0) * (1.4 if d.month == 12 else 1.0)
+                          * (0.6 + 0.8 * i / HISTORY_DAYS) for i, d in enumerate(days))
+    done = 0
+    while done < n:
+        k = min(batch_size, n - done)
+        batch = []
+        for cat, day in zip(rng.choices(cats, cum_weights=cat_cum, k=k),
+                            rng.choices(days, cum_weights=day_cum, k=k)):
+            mu, sigma = CATEGORY_AMOUNTS[cat]
+            batch.append({
+                "description": f"{rng.choice(MERCHANTS[cat])} #{rng.randrange(1, 500)}",
+                "amount": round(min(rng.lognormvariate(mu, sigma), 99_999.0), 2),
+                "category": cat,
+                "date": day.isoformat(),
+                "created_at": datetime(day.year, day.month, day.day, rng.randrange(24), rng.randrange(60)),
+            })
+        done += k
+        yield batch
+
+
+def _cumulative(weights):
+    total, out = 0.0, []
+    for w in weights:
+        total += w
+        out.append(total)
+    return out
+
+
+# --------------------------
+# Stores
+# --------------------------
+def open_bench_storage(backend, size, workdir, mongo_uri):
+    if backend == "sqlite":
+        return open_storage("sqlite:///" + os.path.join(workdir, f"bench_{size}.db"))
+    if backend == "mongo":
+        return open_storage(mongo_uri, "expense_bench", f"expenses_{size}")
+    if backend == "mongomock":
+        import mongomock  # in-process stand-in; slow above ~100k rows
+        from mongo_storage import MongoStorage
+        return MongoStorage(db_name="expense_bench", collection_name=f"expenses_{size}",
+                            client=mongomock.MongoClient())
+    raise ValueError(f"Unknown backend {backend!r}")
+
+
+def seed(storage, size, seed_value=SEED, progress=None):
+    """Fill `storage` with `size` synthetic expenses; returns the seconds taken."""
+    start = time.perf_counter()
+    if storage.count({}):
+        storage.delete(query={})
+    done = 0
+    for batch in synthetic_batches(size, seed_value):
+        storage.insert_many(batch, update_rollups=False)
+        done += len(batch)
+        if progress:
+            progress(done, size)
+    storage.rebuild_rollups()
+    return time.perf_counter() - start
+
+
+# --------------------------
+# Timing
+# --------------------------
+class Recorder:
+    """Collects {operation: {median, min, runs, rows}} for one dataset size."""
+
+    def __init__(self, repeat=REPEAT, verbose=True):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = {}
+
+    def time(self, name, fn, repeat=None):
+        """Run `fn` `repeat` times; its return value (a row count or None) is kept as `rows`."""
+        runs, rows = [], None
+        try:
+            for _ in range(repeat or self.repeat):
+                start = time.perf_counter()
+                rows = fn()
+                runs.append(time.perf_counter() - start)
+        except Exception as e:  # recorded, so one unsupported operation does not end the run
+            self.results[name] = {"error": f"{type(e).__name__}: {e}"}
+            if self.verbose:
+                print(f"  {name:<28} ERROR {e}", file=sys.stderr)
+            return None
+        entry = {"median": statistics.median(runs), "min": min(runs), "runs": runs}
+        if isinstance(rows, int):
+            entry["rows"] = rows
+        self.results[name] = entry
+        if self.verbose:
+            print(f"  {name:<28} {entry['median'] * 1000:10.1f} ms", file=sys.stderr)
+        return rows
+
+    def skip(self, name, reason):
+        self.results[name] = {"skipped": reason}
+        if self.verbose:
+            print(f"  {name:<28} skipped: {reason}", file=sys.stderr)
+
+
+def _first_page(storage, query, sort_field="date", descending=False):
+    pager = KeysetPager(storage, query, sort_field, descending)
+    pager.get(0, PAGE_ROWS)
+    return pager
+
+
+def _reload(storage, query, sort_field="date", descending=False):
+    # what a table reload costs: count + first page + server-side summary
+    pager = _first_page(storage, query, sort_field, descending)
+    storage.summarize(query)
+    return pager.count
+
+
+def bench_reads(rec, storage, workdir):
+    last_quarter = build_query("2025-10-01", "2025-12-31")
+    rec.time("load_all_expenses", lambda: _reload(storage, {}))
+    rec.time("apply_filters_date", lambda: _reload(storage, last_quarter))
+    rec.time("apply_filters_search", lambda: _reload(storage, build_query(search="coffee")))
+    rec.time("search_two_words", lambda: _reload(storage, build_query(search="coffee 12")))
+    for field in ("amount", "description", "category"):
+        rec.time(f"sort_by_{field}", lambda f=field: _first_page(storage, {}, f).count)
+    rec.time("sort_by_date_desc", lambda: _first_page(storage, {}, "date", True).count)
+
+    def deep_page():
+        pager = KeysetPager(storage, {}, "amount")
+        pager.get(pager.count // 2, PAGE_ROWS)
+        return pager.count
+    rec.time("page_middle_by_amount", deep_page)
+
+    from charts import chart_data  # loads matplotlib (not timed); chart_data itself draws nothing
+
+    def graphs():
+        rows = storage.read_rollups(last_quarter)
+        chart_data(rows)
+        return len(rows)
+    rec.time("show_graphs_query", graphs)
+
+    import exporters
+    csv_path = os.path.join(workdir, "export.csv")
+    rec.time("export_csv", lambda: exporters.export_csv(storage, csv_path), repeat=1)
+    rec.time("export_xlsx_quarter", lambda: exporters.export_xlsx(storage, os.path.join(workdir, "export.xlsx"),
+                                                                   last_quarter), repeat=1)
+    if exporters._load_pyarrow():
+        out_dir = os.path.join(workdir, "export_parquet")
+
+        def parquet():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            return exporters.export_columnar(storage, out_dir)
+        rec.time("export_parquet", parquet, repeat=1)
+    else:
+        rec.skip("export_parquet", "pyarrow not installed")
+
+
+def bench_columns(rec, storage):
+    from column_store import STORE_LIMIT, ArrayPager, ExpenseColumns
+
+    if storage.count({}) > STORE_LIMIT:
+        rec.skip("column_store_load", f"more than STORE_LIMIT ({STORE_LIMIT}) rows")
+        return
+    holder = {}
+
+    def load():
+        holder["cols"] = ExpenseColumns.load(storage)
+        return len(holder["cols"])
+    if rec.time("column_store_load", load, repeat=1) is None:
+        return
+    cols = holder["cols"]
+    for field in ("date", "amount", "description", "category"):
+        rec.time(f"column_store_sort_{field}", lambda f=field: ArrayPager(cols, {}, f).count)
+    quarter = build_query("2025-10-01", "2025-12-31")
+    rec.time("column_store_filter_date", lambda: (cols.summarize(quarter), ArrayPager(cols, quarter).count)[1])
+
+
+def bench_ui(rec, storage):
+    """Treeview population / scrolling and the charts window, on a real (possibly Xvfb) display."""
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        for name in ("treeview_populate", "treeview_scroll", "charts_show"):
+            rec.skip(name, f"no display ({e}); run under xvfb-run")
+        return
+    from app import ExpenseTrackerApp
+    from charts import ChartsPanel
+    from virtual_table import VirtualTable
+
+    try:
+        root.geometry("960x620")
+        columns = ("id", "description", "amount", "category", "date")
+        table = VirtualTable(root, columns, ExpenseTrackerApp.row_values)
+        table.pack(fill="both", expand=True)
+        root.update()
+
+        def populate():
+            table.set_pager(KeysetPager(storage, {}, "date"))
+            root.update()
+            return table.count
+
+        def scroll():
+            table.scroll_to(0)
+            for _ in range(50):
+                table.scroll(table.visible)
+                root.update()
+            return 50 * table.visible
+
+        rec.time("treeview_populate", populate)
+        rec.time("treeview_scroll", scroll)
+
+        charts = ChartsPanel(root)
+        rows = storage.read_rollups({})
+        runs = iter(range(10 ** 6))
+
+        def show():
+            charts.show(next(runs), rows)  # a fresh key each run, so the figures are redrawn
+            root.update()
+            return len(rows)
+        rec.time("charts_show", show)
+    finally:
+        root.destroy()
+
+
+def bench_writes(rec, storage):
+    # destructive, so they run last against the seeded data
+    def insert_100():
+        for i in range(100):
+            storage.insert({"description": f"Benchmark insert {i}", "amount": 9.99, "category": "Other",
+                            "date": "2025-06-15", "created_at": datetime.utcnow()})
+        return 100
+    rec.time("add_expense_x100", insert_100, repeat=1)
+
+    rows = KeysetPager(storage, {}, "date", True).get(0, 100)
+
+    def edit_100():
+        for r in rows:
+            storage.update(r["_id"], r, {"amount": r["amount"] + 1})
+        return len(rows)
+    rec.time("edit_expense_x100", edit_100, repeat=1)
+
+    week = build_query("2025-03-01", "2025-03-07")
+    rec.time("bulk_edit_week", lambda: storage.update_many({"category": "Other"}, query=week), repeat=1)
+    ids = [r["_id"] for r in KeysetPager(storage, {}, "amount").get(0, 200)]
+    rec.time("delete_selected_200", lambda: storage.delete(ids=ids), repeat=1)
+    rec.time("delete_filtered_month", lambda: storage.delete(query=build_query("2024-02-01", "2024-02-29")), repeat=1)
+
+
+# --------------------------
+# Runner
+# --------------------------
+def _git_commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, backend="sqlite", mongo_uri="mongodb://localhost:27017/", repeat=REPEAT, ui=True,
+        writes=True, seed_value=SEED, verbose=True):
+    """Run the suite for every size; returns the JSON-ready result."""
+    result = {
+        "meta": {
+            "commit": _git_commit(), "backend": backend, "seed": seed_value, "repeat": repeat,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "started": datetime.now().isoformat(timespec="seconds"),
+        },
+        "sizes": {},
+    }
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"expense_bench_{size}_")
+        storage = None
+        try:
+            storage = open_bench_storage(backend, size, workdir, mongo_uri)
+            storage.ensure_schema()
+            if backend == "mongomock":
+                # mongomock ignores partialFilterExpression, so the unique import_hash index would
+                # reject every seeded row (none has a hash); imports are not benchmarked here
+                storage.collection.drop_index("import_hash")
+            if verbose:
+                print(f"{size} rows ({backend})", file=sys.stderr)
+            progress = None if not verbose else (
+                lambda done, total: print(f"\r  seeding {done}/{total}", end="", file=sys.stderr, flush=True))
+            seconds = seed(storage, size, seed_value, progress)
+            if verbose:
+                print(file=sys.stderr)
+            rec = Recorder(repeat, verbose)
+            rec.results["seed"] = {"median": seconds, "min": seconds, "runs": [seconds], "rows": size}
+            bench_reads(rec, storage, workdir)
+            bench_columns(rec, storage)
+            if ui:
+                bench_ui(rec, storage)
+            if writes:
+                bench_writes(rec, storage)
+            result["sizes"][str(size)] = rec.results
+        finally:
+            if storage is not None:
+                if backend == "mongo":
+                    storage.db.drop_collection(storage.collection.name)
+                    storage.db.drop_collection("expense_rollups")
+                storage.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def compare(current, baseline, threshold=REGRESSION):
+    """Lines describing each operation's change against `baseline`, and the regressions among them."""
+    lines, regressions = [], []
+    for size, ops in current["sizes"].items():
+        old_ops = baseline.get("sizes", {}).get(size, {})
+        for name, entry in ops.items():
+            old = old_ops.get(name, {})
+            if "median" not in entry or "median" not in old or not old["median"]:
+                continue
+            ratio = entry["median"] / old["median"]
+            line = f"{size:>8} {name:<28} {old['median'] * 1000:10.1f} -> {entry['median'] * 1000:10.1f} ms  x{ratio:.2f}"
+            lines.append(line)
+            if ratio >= threshold and entry["median"] >= NOISE_FLOOR:
+                regressions.append(line)
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the data and UI hot paths on synthetic expenses.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated row counts")
+    parser.add_argument("--backend", choices=BACKENDS, default="sqlite")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/",
+                        help="server for --backend mongo (uses the expense_bench database)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--no-ui", action="store_true", help="skip the Treeview / charts timings")
+    parser.add_argument("--no-writes", action="store_true", help="skip inserts, edits and deletes")
+    parser.add_argument("--startup", action="store_true", help="also record startup_bench timings")
+    parser.add_argument("--out", help="JSON result file (default: benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    result = run(sizes, args.backend, args.mongo_uri, args.repeat, not args.no_ui, not args.no_writes, args.seed)
+    if args.startup:
+        import startup_bench
+        result["startup"] = startup_bench.measure()
+    out = args.out or f"benchmark-{result['meta']['commit'] or 'unknown'}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {out}")
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressions = compare(result, baseline, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} operation(s) at least x{args.threshold:.2f} slower:")
+        print("\n".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
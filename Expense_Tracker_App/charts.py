@@ -0,0 +1,140 @@
+import tkinter as tk
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+# --------------------------
+# Chart data
+# --------------------------
+MAX_TICK_LABELS = 12
+
+
+def bucket_for(first, last):
+    """'day', 'week' or 'month' so the bar chart keeps a readable number of bars."""
+    span = (last - first).days
+    if span <= 62:
+        return "day"
+    if span <= 366:
+        return "week"
+    return "month"
+
+
+def _bucket_key(d, bucket):
+    if bucket == "month":
+        return d.strftime("%Y-%m")
+    if bucket == "week":
+        return (d - timedelta(days=d.weekday())).isoformat()  # Monday of that week
+    return d.isoformat()
+
+
+def chart_data(rows):
+    """Category and bucketed date totals from rollup rows (see rollups.read_rollups)."""
+    by_cat, by_day = {}, {}
+    for r in rows:
+        by_cat[r["category"]] = by_cat.get(r["category"], 0.0) + r["total"]
+        try:
+            d = date.fromisoformat(r["date"])
+        except (TypeError, ValueError):
+            continue
+        by_day[d] = by_day.get(d, 0.0) + r["total"]
+    bucket = bucket_for(min(by_day), max(by_day)) if by_day else "day"
+    by_bucket = {}
+    for d in sorted(by_day):
+        key = _bucket_key(d, bucket)
+        by_bucket[key] = by_bucket.get(key, 0.0) + by_day[d]
+    cats = sorted(by_cat.items(), key=lambda kv: kv[1], reverse=True)
+    return {"categories": cats, "bucket": bucket, "dates": list(by_bucket.items())}
+
+
+# --------------------------
+# Charts window
+# --------------------------
+class ChartsPanel:
+    """The "Expense Charts" window, kept alive between openings.
+
+    The two figures and their canvases are created once. New data updates
+    the existing bar artists in place when the number of buckets is
+    unchanged, and chart data is cached per key (data version + filter), so
+    reopening charts on unchanged data only raises the window.
+    """
+
+    def __init__(self, root, cache_size=8):
+        self.root = root
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # key -> chart data
+        self.shown_key = None
+        self.dlg = None
+        self.bars = None
+
+    def has(self, key):
+        return key in self.cache
+
+    def show(self, key, rows=None):
+        """Display the charts for `key`; `rows` are only needed when the key is not cached."""
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            self.cache[key] = chart_data(rows or [])
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self._ensure_window()
+        if key != self.shown_key:
+            self._render(self.cache[key])
+            self.shown_key = key
+        self.dlg.deiconify()
+        self.dlg.lift()
+
+    def _ensure_window(self):
+        if self.dlg is not None and self.dlg.winfo_exists():
+            return
+        self.dlg = tk.Toplevel(self.root)
+        self.dlg.title("Expense Charts")
+        self.dlg.geometry("900x600")
+        self.dlg.transient(self.root)
+        # closing only hides the window so the figures survive for next time
+        self.dlg.protocol("WM_DELETE_WINDOW", self.dlg.withdraw)
+
+        self.fig1 = Figure(figsize=(4,4))
+        self.ax1 = self.fig1.add_subplot(111)
+        self.canvas1 = FigureCanvasTkAgg(self.fig1, master=self.dlg)
+        self.canvas1.get_tk_widget().pack(side="left", fill="both", expand=True, padx=6, pady=6)
+
+        self.fig2 = Figure(figsize=(5,4))
+        self.ax2 = self.fig2.add_subplot(111)
+        self.ax2.set_ylabel("Amount (DZD)")
+        self.canvas2 = FigureCanvasTkAgg(self.fig2, master=self.dlg)
+        self.canvas2.get_tk_widget().pack(side="left", fill="both", expand=True, padx=6, pady=6)
+        self.bars = None
+        self.shown_key = None
+
+    def _render(self, data):
+        # pie by category (at most a handful of wedges, cheap to redraw)
+        self.ax1.clear()
+        cats = data["categories"]
+        if cats:
+            self.ax1.pie([v for _, v in cats], labels=[c for c, _ in cats], autopct='%1.1f%%', startangle=90)
+        self.ax1.set_title("Expenses by Category")
+        self.canvas1.draw_idle()
+
+        # bar by date bucket
+        labels = [k for k, _ in data["dates"]]
+        heights = [v for _, v in data["dates"]]
+        if self.bars is not None and len(self.bars) == len(heights):
+            for bar, h in zip(self.bars, heights):
+                bar.set_height(h)
+        else:
+            if self.bars is not None:
+                self.bars.remove()
+            self.bars = self.ax2.bar(range(len(heights)), heights, color="#7C3AED")
+        step = max(1, -(-len(labels) // MAX_TICK_LABELS))
+        self.ax2.set_xticks(range(0, len(labels), step))
+        self.ax2.set_xticklabels(labels[::step], rotation=45, ha="right")
+        self.ax2.set_xlim(-0.5, max(len(labels), 1) - 0.5)
+        self.ax2.relim()
+        self.ax2.autoscale_view(scalex=False)
+        self.ax2.set_title(f"Expenses by {data['bucket'].capitalize()}")
+        self.ax2.set_xlabel(data["bucket"].capitalize())
+        self.fig2.tight_layout()
+        self.canvas2.draw_idle()
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from queries import build_query, format_categories, format_summary, is_iso_date
+from storage import DEFAULT_URL, open_storage
+
+# --------------------------
+# Headless command line
+# --------------------------
+# Batch jobs (nightly exports, reports, statement imports, rollup repairs) run
+# the same data layer as the app without loading tkinter, tkcalendar or
+# matplotlib, so they start quickly and work on machines with no display:
+#
+#   python cli.py export csv expenses.csv --from 2024-01-01
+#   python cli.py summary --monthly --json
+#   python cli.py import statement.ofx
+#   python cli.py rollup-rebuild --verify
+#
+# The storage URL defaults to $EXPENSE_TRACKER_STORAGE, like the app.
+
+EXPORT_FORMATS = ("csv", "xlsx", "parquet", "arrow")
+
+
+def _progress(label):
+    # carriage-return progress on stderr, throttled so it never slows the export down
+    state = {"at": 0.0}
+
+    def report(done, total):
+        now = time.monotonic()
+        if now - state["at"] >= 0.2 or done == total:
+            state["at"] = now
+            print(f"\r{label} {done}/{total}", end="", file=sys.stderr, flush=True)
+    return report
+
+
+def _filter_args(parser):
+    parser.add_argument("--from", dest="date_from", default="", help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--to", dest="date_to", default="", help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--search", default="", help="words the description must contain (prefixes)")
+
+
+def _query(args):
+    for name, value in (("--from", args.date_from), ("--to", args.date_to)):
+        if value and not is_iso_date(value):
+            raise ValueError(f"{name} must be a YYYY-MM-DD date, got {value!r}")
+    return build_query(args.date_from, args.date_to, args.search)
+
+
+# --------------------------
+# Commands
+# --------------------------
+def cmd_export(storage, args):
+    import exporters
+
+    query = _query(args)
+    progress = None if args.quiet else _progress("Exported")
+    if args.format == "csv":
+        n = exporters.export_csv(storage, args.path, query, progress=progress)
+    elif args.format == "xlsx":
+        n = exporters.export_xlsx(storage, args.path, query, progress=progress)
+    else:
+        n = exporters.export_columnar(storage, args.path, query, fmt=args.format, progress=progress)
+    if progress:
+        print(file=sys.stderr)
+    print(f"Exported {n} expense(s) to {args.path}")
+    return 0
+
+
+def cmd_summary(storage, args):
+    query = _query(args)
+    summary = storage.summarize(query)
+    months = None
+    if args.monthly:
+        months = {}
+        for r in storage.read_rollups(query):
+            month = (r["date"] or "")[:7]
+            m = months.setdefault(month, {"total": 0.0, "count": 0})
+            m["total"] += r["total"]
+            m["count"] += r["count"]
+    if args.json:
+        out = dict(summary, query=query)
+        if months is not None:
+            out["by_month"] = dict(sorted(months.items()))
+        print(json.dumps(out, indent=2))
+        return 0
+    print(format_summary(summary))
+    if summary["count"]:
+        print(f"Total: {summary['total']:.2f}")
+        print(format_categories(summary))
+    for month, m in sorted((months or {}).items()):
+        print(f"{month or '?':>7}  {m['count']:>8}  {m['total']:>12.2f}")
+    return 0
+
+
+def cmd_import(storage, args):
+    from importer import MAX_ERRORS, format_result, import_file
+
+    storage.ensure_schema()
+    progress = None if args.quiet else _progress("Read bytes")
+    result = import_file(storage, args.path, args.format, args.date_format, args.negate, args.category,
+                         progress=progress)
+    if progress:
+        print(file=sys.stderr)
+    print(format_result(result, max_lines=MAX_ERRORS))
+    return 0 if not result["error_count"] else 1
+
+
+def cmd_rollup_rebuild(storage, args):
+    storage.ensure_schema()
+    storage.rebuild_rollups()
+    print("Rollups rebuilt.")
+    if not args.verify:
+        return 0
+    problems = storage.verify_rollups()
+    for p in problems:
+        print(p)
+    print("Rollups match the expenses." if not problems else f"{len(problems)} mismatch(es).")
+    return 0 if not problems else 1
+
+
+COMMANDS = {"export": cmd_export, "summary": cmd_summary, "import": cmd_import, "rollup-rebuild": cmd_rollup_rebuild}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Expense Tracker batch commands (no GUI).")
+    parser.add_argument("--storage", default=os.environ.get("EXPENSE_TRACKER_STORAGE", DEFAULT_URL),
+                        help="mongodb://... or sqlite:///path.db (default: $EXPENSE_TRACKER_STORAGE)")
+    parser.add_argument("--db", default="expense_db")
+    parser.add_argument("--collection", default="expenses")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="export the (filtered) expenses")
+    p.add_argument("format", choices=EXPORT_FORMATS)
+    p.add_argument("path", help="output file, or output directory for parquet / arrow")
+    _filter_args(p)
+
+    p = sub.add_parser("summary", help="print totals for the (filtered) expenses")
+    _filter_args(p)
+    p.add_argument("--monthly", action="store_true", help="add per-month totals")
+    p.add_argument("--json", action="store_true", help="machine-readable output")
+
+    from importer import IMPORT_FORMATS
+    p = sub.add_parser("import", help="import a CSV or OFX bank statement")
+    p.add_argument("path")
+    p.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    p.add_argument("--date-format", help="strptime format of the CSV dates, e.g. %%d/%%m/%%Y")
+    p.add_argument("--negate", action="store_true", help="CSV lists spending as negative amounts")
+    p.add_argument("--category", default="Other", help="category for rows without one")
+
+    p = sub.add_parser("rollup-rebuild", help="recompute the day x category rollups")
+    p.add_argument("--verify", action="store_true", help="check the rebuilt rollups against the expenses")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    storage = open_storage(args.storage, args.db, args.collection)
+    try:
+        return COMMANDS[args.command](storage, args)
+    except (ValueError, RuntimeError, FileExistsError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+from datetime import date
+
+import numpy as np
+
+from queries import CATEGORIES, SORT_FIELDS, summary_from_groups
+
+# --------------------------
+# In-memory column store
+# --------------------------
+# When every expense fits in memory, the table sorts and filters a typed,
+# array-backed copy instead of querying: float64 amounts, int32 date ordinals
+# and int16 category codes, sorted with argsort / lexsort and filtered with
+# boolean masks. Only the visible slice is turned back into row dicts.
+
+STORE_LIMIT = 250_000  # above this many expenses the table pages from storage instead
+LOAD_FIELDS = ["_id", "description", "amount", "category", "date"]
+NO_DATE = 0  # ordinal for a missing / malformed date; sorts first like "" does
+PLACE_LIMIT = 1000  # appends up to this many rows keep the rank keys, bigger ones rebuild them
+
+
+def _lowered(descriptions):
+    return np.array([d.lower() for d in descriptions] + [None], dtype=object)[:-1]
+
+
+def _ordinal(value):
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return NO_DATE
+
+
+class ExpenseColumns:
+    """Every expense as parallel arrays, one position per row.
+
+    Mutated only on the Tk thread, in step with the app's own writes
+    (append / update / remove / assign); views taken before a mutation
+    must be rebuilt.
+    """
+
+    def __init__(self, rows=()):
+        rows = list(rows)
+        self.categories = list(CATEGORIES)
+        self._codes = {c: i for i, c in enumerate(self.categories)}
+        self.ids = np.array([r["_id"] for r in rows] + [None], dtype=object)[:-1]
+        self.descriptions = np.array([r.get("description") or "" for r in rows] + [None], dtype=object)[:-1]
+        self.amounts = np.array([float(r.get("amount") or 0.0) for r in rows], dtype=np.float64)
+        self.ordinals = np.array([_ordinal(r.get("date")) for r in rows], dtype=np.int32)
+        self.codes = np.array([self._code(r.get("category")) for r in rows], dtype=np.int16)
+        self._ranks = {}  # sort keys that need a full sort of Python objects, built on demand
+        self._ranked = {}  # name -> (sorted distinct values, their keys) behind each rank, see _place
+        self._index = None  # str(_id) -> position, built on demand
+
+    @classmethod
+    def load(cls, storage, check=None, batch_size=10000):
+        """Read every expense from `storage` in batches (run on a worker thread)."""
+        rows = []
+        for batch in storage.iter_batches({}, LOAD_FIELDS, batch_size):
+            if check:
+                check()
+            rows.extend(dict(zip(LOAD_FIELDS, r)) for r in batch)
+        cols = cls(rows)
+        cols._rank("_id", cols.ids)  # the slowest sort key; build it here rather than on the Tk thread
+        return cols
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def _code(self, category):
+        category = category or ""
+        if category not in self._codes:
+            self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return self._codes[category]
+
+    def row(self, i):
+        o = int(self.ordinals[i])
+        return {"_id": self.ids[i], "description": self.descriptions[i], "amount": float(self.amounts[i]),
+                "category": self.categories[self.codes[i]], "date": date.fromordinal(o).isoformat() if o else ""}
+
+    # --------------------------
+    # Filtering / sorting
+    # --------------------------
+    @staticmethod
+    def covers(query):
+        """Whether `query` can be evaluated on the arrays (date equality / range filters only)."""
+        for field, cond in query.items():
+            if field != "date":
+                return False
+            if isinstance(cond, dict) and not set(cond) <= {"$gte", "$gt", "$lte", "$lt"}:
+                return False
+        return True
+
+    def mask(self, query):
+        mask = np.ones(len(self), dtype=bool)
+        cond = query.get("date")
+        if cond is None:
+            return mask
+        if not isinstance(cond, dict):
+            cond = {"$gte": cond, "$lte": cond}
+        for op, bound in cond.items():
+            o = _ordinal(bound)
+            if op == "$gte":
+                mask &= self.ordinals >= o
+            elif op == "$gt":
+                mask &= self.ordinals > o
+            elif op == "$lte":
+                mask &= self.ordinals <= o
+            else:
+                mask &= self.ordinals < o
+        return mask
+
+    def _rank(self, name, values):
+        # key of each row in the sorted order of `values` (equal values share a key)
+        if name not in self._ranks:
+            distinct, inverse = np.unique(values, return_inverse=True)
+            self._ranks[name] = inverse.astype(np.float64)
+            self._ranked[name] = (distinct, np.arange(len(distinct), dtype=np.float64))
+        return self._ranks[name]
+
+    def _place(self, name, value):
+        # key for `value` in an existing rank without re-sorting: a new value gets the midpoint of its
+        # neighbours' keys; None (drop the rank) once floats cannot split that gap any more
+        distinct, keys = self._ranked[name]
+        k = int(np.searchsorted(distinct, value))
+        if k < len(distinct) and distinct[k] == value:
+            return keys[k]
+        lo = keys[k - 1] if k else (keys[0] if len(keys) else 0.0) - 2.0
+        hi = keys[k] if k < len(keys) else lo + 2.0
+        key = (lo + hi) / 2
+        if not lo < key < hi:
+            return None
+        self._ranked[name] = (np.insert(distinct, k, value), np.insert(keys, k, key))
+        return key
+
+    def _drop_rank(self, name):
+        self._ranks.pop(name, None)
+        self._ranked.pop(name, None)
+
+    def sort_key(self, sort_field):
+        if sort_field == "amount":
+            return self.amounts
+        if sort_field == "date":
+            return self.ordinals
+        if sort_field == "category":
+            order = np.argsort(np.array(self.categories, dtype=object))
+            return np.argsort(order)[self.codes]
+        if sort_field == "description":
+            # case-insensitive, like the storage sorts (queries.SORT_KEYS)
+            if "description" not in self._ranks:
+                self._rank("description", _lowered(self.descriptions))
+            return self._ranks["description"]
+        raise ValueError(f"Cannot sort on {sort_field!r}")
+
+    def select(self, query, sort_field="date", descending=False):
+        """Positions of the rows matching `query`, in (sort_field, _id) order like the storage pages."""
+        idx = np.flatnonzero(self.mask(query))
+        if not len(idx):
+            return idx
+        key = self.sort_key(sort_field)
+        order = idx[np.lexsort((self._rank("_id", self.ids)[idx], key[idx]))]
+        return order[::-1] if descending else order
+
+    def summarize(self, query):
+        """Same shape as queries.summarize, from a mask and bincounts."""
+        mask = self.mask(query)
+        codes, amounts = self.codes[mask], self.amounts[mask]
+        n = len(self.categories)
+        totals = np.bincount(codes, weights=amounts, minlength=n)
+        counts = np.bincount(codes, minlength=n)
+        mins = np.full(n, np.inf)
+        maxs = np.full(n, -np.inf)
+        np.minimum.at(mins, codes, amounts)
+        np.maximum.at(maxs, codes, amounts)
+        return summary_from_groups({"_id": self.categories[c], "total": totals[c], "count": int(counts[c]),
+                                    "min": mins[c], "max": maxs[c]} for c in np.flatnonzero(counts))
+
+    # --------------------------
+    # Mutations (mirror the app's own writes)
+    # --------------------------
+    def _positions(self, ids):
+        if self._index is None:
+            self._index = {str(_id): i for i, _id in enumerate(self.ids)}
+        return np.array([self._index[str(i)] for i in ids if str(i) in self._index], dtype=np.intp)
+
+    def append(self, rows):
+        fresh = ExpenseColumns(rows)
+        for name, values in (("_id", fresh.ids), ("description", _lowered(fresh.descriptions))):
+            if name not in self._ranks:
+                continue
+            keys = [self._place(name, v) for v in values] if len(values) <= PLACE_LIMIT else [None]
+            if None in keys:
+                self._drop_rank(name)
+            else:
+                self._ranks[name] = np.concatenate([self._ranks[name], np.array(keys, dtype=np.float64)])
+        self.ids = np.concatenate([self.ids, fresh.ids])
+        self.descriptions = np.concatenate([self.descriptions, fresh.descriptions])
+        self.amounts = np.concatenate([self.amounts, fresh.amounts])
+        self.ordinals = np.concatenate([self.ordinals, fresh.ordinals])
+        self.codes = np.concatenate([self.codes, np.array([self._code(r.get("category")) for r in rows], dtype=np.int16)])
+        self._index = None
+
+    def update(self, row):
+        for i in self._positions([row["_id"]]):
+            self.descriptions[i] = row.get("description") or ""
+            self.amounts[i] = float(row.get("amount") or 0.0)
+            self.ordinals[i] = _ordinal(row.get("date"))
+            self.codes[i] = self._code(row.get("category"))
+            if "description" in self._ranks:
+                key = self._place("description", self.descriptions[i].lower())
+                if key is None:
+                    self._drop_rank("description")
+                else:
+                    self._ranks["description"][i] = key
+
+    def _where(self, ids=None, query=None):
+        if query is not None:
+            return np.flatnonzero(self.mask(query))
+        return self._positions(ids)
+
+    def remove(self, ids=None, query=None):
+        keep = np.ones(len(self), dtype=bool)
+        keep[self._where(ids, query)] = False
+        self.ids, self.descriptions = self.ids[keep], self.descriptions[keep]
+        self.amounts, self.ordinals, self.codes = self.amounts[keep], self.ordinals[keep], self.codes[keep]
+        # removing rows keeps the others' relative order; the keys of values now gone stay in _ranked
+        self._ranks = {name: rank[keep] for name, rank in self._ranks.items()}
+        self._index = None
+
+    def assign(self, changes, ids=None, query=None):
+        """Apply a bulk edit (category / date) to the rows selected by ids or query."""
+        pos = self._where(ids, query)
+        if "category" in changes:
+            self.codes[pos] = self._code(changes["category"])
+        if "date" in changes:
+            self.ordinals[pos] = _ordinal(changes["date"])
+
+
+class ArrayPager:
+    """Pager (see queries.KeysetPager) over a sorted selection of an ExpenseColumns.
+
+    Every row is in memory, so `cached` never misses and the table renders
+    the visible slice without a round-trip.
+    """
+
+    def __init__(self, store, query=None, sort_field="date", descending=False):
+        if sort_field not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort on {sort_field!r}")
+        self.store = store
+        self.query = query or {}
+        self.sort_field = sort_field
+        self.descending = descending
+        self.order = store.select(self.query, sort_field, descending)
+        self.count = len(self.order)
+
+    def get(self, offset, n):
+        return [self.store.row(i) for i in self.order[max(0, offset):max(0, offset + n)]]
+
+    cached = get
+
+    def patch(self, row):
+        return False
+
+    def invalidate(self, count_delta=0):
+        pass
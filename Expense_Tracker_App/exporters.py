@@ -0,0 +1,240 @@
+import csv
+import os
+import shutil
+from datetime import date
+
+from queries import CATEGORIES
+
+# openpyxl and the optional pyarrow are imported on first use, so callers that
+# never export (and the headless CLI) do not pay for loading them
+pa = pq = None
+
+
+def _load_pyarrow():
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pq = pyarrow, pyarrow.parquet
+    return True
+
+# --------------------------
+# Streaming exports
+# --------------------------
+# Rows are read from the storage backend one batch at a time and written
+# straight to the file, so memory use does not depend on how many expenses
+# are exported.
+
+EXPORT_FIELDS = ["description", "amount", "category", "date", "created_at"]
+BATCH_SIZE = 5000
+
+
+def _write_batches(storage, query, write_rows, progress, check, batch_size):
+    total = storage.count(query or {}) if progress else None
+    done = 0
+    for batch in storage.iter_batches(query, EXPORT_FIELDS, batch_size):
+        if check:
+            check()
+        write_rows(batch)
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def _write_atomic(path, write):
+    # write to a side file and only replace `path` once everything is written,
+    # so a cancelled or failed export never leaves a truncated file behind
+    tmp = path + ".part"
+    try:
+        done = write(tmp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return done
+
+
+def export_csv(storage, path, query=None, progress=None, check=None, batch_size=BATCH_SIZE):
+    """Write the expenses matching `query` to `path` as CSV. Returns the row count."""
+    def write(tmp):
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_FIELDS)
+            return _write_batches(storage, query, writer.writerows, progress, check, batch_size)
+    return _write_atomic(path, write)
+
+
+def export_xlsx(storage, path, query=None, progress=None, check=None, batch_size=BATCH_SIZE):
+    """Write the expenses matching `query` to `path` as .xlsx using openpyxl's write-only mode."""
+    from openpyxl import Workbook
+
+    def write(tmp):
+        wb = Workbook(write_only=True)  # rows are flushed to disk as they are appended
+        ws = wb.create_sheet("Expenses")
+        ws.append(EXPORT_FIELDS)
+
+        def write_rows(rows):
+            for r in rows:
+                ws.append(r)
+
+        done = _write_batches(storage, query, write_rows, progress, check, batch_size)
+        wb.save(tmp)
+        return done
+    return _write_atomic(path, write)
+
+
+# --------------------------
+# Columnar export (Parquet / Arrow IPC)
+# --------------------------
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("date", pa.date32()),
+        ("created_at", pa.timestamp("us")),
+    ])
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _month_runs(rows):
+    # rows arrive sorted by date, so each (year, month) is one contiguous run
+    run, key = [], None
+    for r in rows:
+        d = _parse_date(r[3])
+        k = (d.year, d.month) if d else None
+        if run and k != key:
+            yield key, run
+            run = []
+        key = k
+        run.append(r[:3] + (d,) + r[4:])
+    if run:
+        yield key, run
+
+
+class _PartitionWriter:
+    """Writes one year=YYYY/month=MM directory at a time.
+
+    The category dictionary starts as the app's category list; a batch with
+    a category outside it starts a new part file with the extended dictionary
+    (Arrow IPC files cannot replace a dictionary mid-file). A partition the
+    stream comes back to (undated rows between batches) also gets a new part
+    file, never an overwritten one.
+    """
+
+    def __init__(self, root, fmt):
+        self.root = root
+        self.fmt = fmt
+        self.key = None
+        self.parts = {}  # partition key -> number of the last part file written
+        self.writer = None
+        self.dictionary = list(CATEGORIES)
+        self.codes = {c: i for i, c in enumerate(self.dictionary)}
+
+    def _open(self):
+        if self.key:
+            folder = os.path.join(self.root, f"year={self.key[0]}", f"month={self.key[1]:02d}")
+        else:
+            # rows without a usable date; Hive readers treat this name as a null partition value
+            folder = os.path.join(self.root, f"year={NULL_PARTITION}", f"month={NULL_PARTITION}")
+        os.makedirs(folder, exist_ok=True)
+        part = self.parts[self.key] = self.parts.get(self.key, -1) + 1
+        path = os.path.join(folder, f"part-{part}{COLUMNAR_FORMATS[self.fmt]}")
+        schema = _arrow_schema()
+        if self.fmt == "parquet":
+            self.writer = pq.ParquetWriter(path, schema)
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def write(self, key, rows):
+        if key != self.key:
+            self.close()
+            self.key = key
+        grown = False
+        for r in rows:
+            if r[2] is not None and r[2] not in self.codes:
+                self.codes[r[2]] = len(self.dictionary)
+                self.dictionary.append(r[2])
+                grown = True
+        if grown:
+            self.close()
+        if self.writer is None:
+            self._open()
+        cols = list(zip(*rows))
+        category = pa.DictionaryArray.from_arrays(
+            pa.array([self.codes.get(c) for c in cols[2]], type=pa.int32()),
+            pa.array(self.dictionary, type=pa.string()))
+        batch = pa.record_batch([
+            pa.array(cols[0], type=pa.string()),
+            pa.array(cols[1], type=pa.float64()),
+            category,
+            pa.array(cols[3], type=pa.date32()),
+            pa.array(cols[4], type=pa.timestamp("us")),
+        ], schema=_arrow_schema())
+        self.writer.write_batch(batch)
+
+
+def export_columnar(storage, out_dir, query=None, fmt="parquet", progress=None, check=None, batch_size=BATCH_SIZE):
+    """Write the expenses matching `query` as a dataset partitioned by month.
+
+    Layout is out_dir/year=YYYY/month=MM/part-N.parquet (or .arrow for Arrow
+    IPC / Feather v2), readable one month at a time by pyarrow.dataset,
+    pandas or Spark. Columns are typed: float64 amount, date32 date and a
+    dictionary-encoded category. Rows are converted one cursor batch at a
+    time, so memory use stays flat.
+    """
+    if not _load_pyarrow():
+        raise RuntimeError("Columnar export needs pyarrow (pip install pyarrow).")
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format {fmt!r}")
+    if os.path.exists(out_dir) and os.listdir(out_dir):
+        raise FileExistsError(f"{out_dir} is not empty")
+
+    tmp = out_dir.rstrip("/\\") + ".part"
+    shutil.rmtree(tmp, ignore_errors=True)
+    writer = _PartitionWriter(tmp, fmt)
+    try:
+        def write_rows(rows):
+            for key, run in _month_runs(rows):
+                writer.write(key, run)
+
+        done = _write_batches(storage, query, write_rows, progress, check, batch_size)
+        writer.close()
+        if os.path.isdir(tmp):
+            # read the row counts back from the file footers before the dataset replaces out_dir
+            written = pa.dataset.dataset(tmp, format="ipc" if fmt == "arrow" else fmt).count_rows()
+            if written != done:
+                raise RuntimeError(f"Columnar export wrote {written} of {done} rows")
+    except BaseException:
+        writer.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if os.path.isdir(out_dir):
+        os.rmdir(out_dir)
+    if os.path.isdir(tmp):
+        os.replace(tmp, out_dir)
+    else:
+        os.makedirs(out_dir, exist_ok=True)
+    return done
@@ -0,0 +1,258 @@
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sys
+from datetime import datetime
+from functools import lru_cache
+
+from queries import CATEGORIES, validate_expense
+
+# --------------------------
+# Statement import
+# --------------------------
+# Bank statements (CSV or OFX) are read one line at a time, every row goes
+# through the same validation as the form, and valid rows are written in
+# unordered batches. Each row carries an `import_hash`; the unique index on it
+# makes importing the same statement twice a no-op for the rows already stored.
+
+IMPORT_FORMATS = ("csv", "ofx")
+BATCH_SIZE = 5000
+MAX_ERRORS = 1000  # per-row errors kept for the report; the count is always exact
+SEEN_DATES = 31  # dates whose identical-row counts are kept while reading (see content_hash)
+
+# lower-cased CSV header names understood for each field, first match wins
+CSV_COLUMNS = {
+    "description": ("description", "memo", "payee", "name", "details", "narrative", "label", "reference"),
+    "amount": ("amount", "debit", "debit amount", "value", "withdrawal"),
+    "category": ("category",),
+    "date": ("date", "transaction date", "posted", "posting date", "booking date", "value date"),
+}
+
+
+def detect_format(path):
+    return "ofx" if os.path.splitext(path)[1].lower() in (".ofx", ".qfx") else "csv"
+
+
+def normalize_amount(text, negate=False):
+    """'1,234.50' / '1234,50' / '-12.5' -> canonical text for validation; bad input is passed through."""
+    text = (text or "").strip().replace(" ", "").replace("\xa0", "")
+    if "," in text and "." in text:
+        text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    if negate and text:
+        text = text[1:] if text.startswith("-") else "-" + text
+    return text
+
+
+@lru_cache(maxsize=4096)
+def _reformat_date(text, date_format):
+    try:
+        return datetime.strptime(text, date_format).strftime("%Y-%m-%d")
+    except ValueError:
+        return text
+
+
+def normalize_date(text, date_format=None):
+    """Date text -> YYYY-MM-DD, parsed with `date_format` or as ISO; bad input is passed through.
+
+    Always written back zero-padded ('2024-1-5' -> '2024-01-05'): queries,
+    sorting and the column store all rely on plain string order.
+    """
+    return _reformat_date((text or "").strip(), date_format or "%Y-%m-%d")
+
+
+# --------------------------
+# Readers (yield line number + raw fields, never the whole file)
+# --------------------------
+def _header_map(header):
+    names = [h.strip().lower() for h in header]
+    mapping = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                mapping[field] = names.index(alias)
+                break
+    missing = [f for f in ("description", "amount", "date") if f not in mapping]
+    if missing:
+        raise ValueError(f"CSV header has no column for: {', '.join(missing)}")
+    return mapping
+
+
+def read_csv(f):
+    """Yield (line, description, amount, category, date, source_id) from a CSV with a header row."""
+    sample = f.read(4096)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(f, dialect)
+    header = next(reader, None)
+    if header is None:
+        return
+    cols = _header_map(header)
+    cat = cols.get("category")
+    for row in reader:
+        if not any(row):
+            continue
+        get = lambda i: row[i] if i is not None and i < len(row) else ""
+        yield (reader.line_num, get(cols["description"]).strip(), get(cols["amount"]),
+               get(cat).strip(), get(cols["date"]), None)
+
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)")
+
+
+def read_ofx(f):
+    """Yield (line, description, amount, category, date, source_id) for every <STMTTRN> of an OFX/QFX file.
+
+    Handles both SGML (OFX 1.x, unclosed leaf tags) and XML (OFX 2.x).
+    Amounts are reported as spent, i.e. with TRNAMT's sign flipped: debits
+    become positive, credits negative (and then fail validation).
+    """
+    account, trn, start = "", None, 0
+    for lineno, line in enumerate(f, 1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag, value = tag.upper(), value.strip()
+            if tag == "STMTTRN":
+                if trn is not None:
+                    yield _ofx_row(start, trn, account)
+                trn, start = ({}, lineno) if not closing else (None, 0)
+            elif tag == "ACCTID" and not closing:
+                account = value
+            elif trn is not None and not closing and value:
+                trn[tag] = value
+    if trn is not None:
+        yield _ofx_row(start, trn, account)
+
+
+def _ofx_row(lineno, trn, account):
+    posted = trn.get("DTPOSTED", "")
+    day = f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) >= 8 and posted[:8].isdigit() else posted
+    desc = trn.get("NAME") or trn.get("MEMO") or trn.get("PAYEE") or ""
+    amount = normalize_amount(trn.get("TRNAMT", ""), negate=True)
+    fitid = trn.get("FITID")
+    return lineno, desc, amount, "", day, f"{account}|{fitid}" if fitid else None
+
+
+# --------------------------
+# Import
+# --------------------------
+def content_hash(rec, seen, source_id=None):
+    """Stable id of one statement row.
+
+    The bank's own transaction id is used when the file has one (OFX FITID).
+    Otherwise the row's content is hashed along with how many identical rows
+    came before it in the file, so two identical purchases on one day both
+    import, and re-importing the statement still skips them. Identical rows
+    share a date, so `seen` keeps the counts per date and only for the
+    SEEN_DATES dates read most recently: statements list rows in date order,
+    and memory stays flat however long the file is.
+    """
+    if source_id:
+        return hashlib.sha1(f"ofx|{source_id}".encode("utf-8")).hexdigest()
+    content = f"{rec['date']}|{rec['amount']:.2f}|{rec['description']}|{rec['category']}"
+    counts = seen.pop(rec["date"], None)
+    if counts is None:
+        counts = {}
+        while len(seen) >= SEEN_DATES:
+            del seen[next(iter(seen))]  # least recently read date
+    seen[rec["date"]] = counts
+    occurrence = counts.get(content, 0)
+    counts[content] = occurrence + 1
+    return hashlib.sha1(f"{content}|{occurrence}".encode("utf-8")).hexdigest()
+
+
+def new_result():
+    return {"read": 0, "inserted": 0, "duplicates": 0, "errors": [], "error_count": 0}
+
+
+def import_file(storage, path, fmt=None, date_format=None, negate=False, default_category="Other",
+                progress=None, check=None, batch_size=BATCH_SIZE):
+    """Import a CSV or OFX statement into `storage`; returns a result dict.
+
+    `errors` holds (line, message) for the first MAX_ERRORS invalid rows.
+    `negate` flips CSV amounts for banks that list spending as negative
+    numbers. Rows without a category get `default_category`.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format {fmt!r}")
+    if default_category not in CATEGORIES:
+        raise ValueError(f"Unknown category {default_category!r}")
+    result = new_result()
+    size = os.path.getsize(path) or 1
+    batch, seen = [], {}
+
+    def flush():
+        inserted, duplicates = storage.import_batch(batch)
+        result["inserted"] += inserted
+        result["duplicates"] += duplicates
+        batch.clear()
+
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        rows = read_ofx(f) if fmt == "ofx" else read_csv(f)
+        for lineno, desc, amount_text, category, date_text, source_id in rows:
+            result["read"] += 1
+            if fmt == "csv":
+                amount_text = normalize_amount(amount_text, negate)
+                date_text = normalize_date(date_text, date_format)
+            category = category or default_category
+            ok, msg = validate_expense(desc, amount_text, category, date_text)
+            if not ok:
+                result["error_count"] += 1
+                if len(result["errors"]) < MAX_ERRORS:
+                    result["errors"].append((lineno, msg))
+                continue
+            rec = {"description": desc, "amount": float(amount_text), "category": category,
+                   "date": date_text, "created_at": datetime.utcnow()}
+            rec["import_hash"] = content_hash(rec, seen, source_id)
+            batch.append(rec)
+            if len(batch) >= batch_size:
+                if check:
+                    check()
+                flush()
+                if progress:
+                    progress(f.buffer.tell(), size)
+        if batch:
+            flush()
+    return result
+
+
+def format_result(result, max_lines=15):
+    lines = [f"Read {result['read']} row(s): {result['inserted']} imported, "
+             f"{result['duplicates']} already present, {result['error_count']} invalid."]
+    for lineno, msg in result["errors"][:max_lines]:
+        lines.append(f"  line {lineno}: {msg}")
+    if result["error_count"] > max_lines:
+        lines.append(f"  … and {result['error_count'] - max_lines} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from storage import DEFAULT_URL, open_storage
+
+    parser = argparse.ArgumentParser(description="Import a bank statement (CSV or OFX) into the expenses.")
+    parser.add_argument("path")
+    parser.add_argument("--storage", default=os.environ.get("EXPENSE_TRACKER_STORAGE", DEFAULT_URL))
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    parser.add_argument("--date-format", help="strptime format of the CSV dates, e.g. %%d/%%m/%%Y")
+    parser.add_argument("--negate", action="store_true", help="CSV lists spending as negative amounts")
+    parser.add_argument("--category", default="Other", help="category for rows without one")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    storage = open_storage(args.storage)
+    storage.ensure_schema()
+    result = import_file(storage, args.path, args.format, args.date_format, args.negate, args.category,
+                         batch_size=args.batch_size)
+    print(format_result(result, max_lines=MAX_ERRORS))
+    storage.close()
+    return 0 if not result["error_count"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
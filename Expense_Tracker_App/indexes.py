@@ -0,0 +1,172 @@
+import argparse
+import sys
+from datetime import datetime
+
+from queries import build_query, keyset_filter, sort_spec, SORT_FIELDS
+
+# --------------------------
+# Index declarations
+# --------------------------
+# Every table sort is (field, _id) so keyset paging walks one index in order
+# (descriptions through their lower-cased copy, see queries.SORT_KEYS);
+# (category, date) serves category filters combined with a date range.
+# import_hash makes re-importing a statement skip the rows already stored.
+# Declared as plain (name, keys, unique, partial filter) tuples so the SQLite
+# backend can read them without importing pymongo.
+INDEXES = [
+    ("date_id", [("date", 1), ("_id", 1)], False, None),
+    ("amount_id", [("amount", 1), ("_id", 1)], False, None),
+    ("description_lower_id", [("description_lower", 1), ("_id", 1)], False, None),
+    ("category_id", [("category", 1), ("_id", 1)], False, None),
+    ("category_date", [("category", 1), ("date", 1)], False, None),
+    # description search: one multikey entry per word prefix, pages in date order
+    ("terms_date_id", [("terms", 1), ("date", 1), ("_id", 1)], False, None),
+    # content hash of imported statement rows; expenses typed into the form have none
+    ("import_hash", [("import_hash", 1)], True, {"import_hash": {"$type": "string"}}),
+]
+# indexes an earlier version declared; dropped by ensure_indexes
+RETIRED_INDEXES = ["description_id"]
+
+
+def index_models():
+    """INDEXES as pymongo IndexModels."""
+    from pymongo import IndexModel
+
+    models = []
+    for name, keys, unique, partial in INDEXES:
+        options = {"name": name, "unique": True} if unique else {"name": name}
+        if partial:
+            options["partialFilterExpression"] = partial
+        models.append(IndexModel(keys, **options))
+    return models
+
+
+def ensure_indexes(collection):
+    """Create any declared index that is missing (a no-op when all exist) and drop retired ones."""
+    existing = collection.index_information()
+    for name in RETIRED_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
+    return collection.create_indexes(index_models())
+
+
+# --------------------------
+# Explain-plan checks
+# --------------------------
+def query_shapes(sample_date=None):
+    """(name, kind, query, sort_field, anchor) for every query shape the app sends.
+
+    `kind` is "page" (a keyset page after `anchor`, or the first page when it
+    is None), "count" or "summary". Values are placeholders: only the shape
+    matters to the planner. Backends turn each shape into their own query,
+    the anchor's 24-hex `_id` included.
+    """
+    day = sample_date or datetime.now().strftime("%Y-%m-%d")
+    anchor = {"_id": "0" * 24, "date": day, "amount": 1.0, "description": "", "category": "Food"}
+    ranged = build_query(day, day)
+    shapes = []
+    for field in SORT_FIELDS:
+        shapes.append((f"first page by {field}", "page", {}, field, None))
+        shapes.append((f"next page by {field}", "page", {}, field, anchor))
+    shapes.append(("date range, first page", "page", ranged, "date", None))
+    shapes.append(("date range, next page", "page", ranged, "date", anchor))
+    shapes.append(("category + date range", "page", {"category": "Food", **ranged}, "date", None))
+    shapes.append(("search + date range", "page", build_query(day, day, "coffee"), "date", None))
+    shapes.append(("search, next page", "page", build_query(search="coffee"), "date", anchor))
+    shapes.append(("date range count", "count", ranged, None, None))
+    shapes.append(("date range summary", "summary", ranged, None, None))
+    return shapes
+
+
+def _stages(plan):
+    # flatten a (possibly nested) explain plan into its stage names
+    if not isinstance(plan, dict):
+        return []
+    out = []
+    if "stage" in plan:
+        out.append((plan["stage"], plan.get("indexName")))
+    for key in ("queryPlan", "inputStage", "outerStage", "innerStage"):
+        out.extend(_stages(plan.get(key)))
+    for sub in plan.get("inputStages", []):
+        out.extend(_stages(sub))
+    return out
+
+
+def _winning_plan(explain):
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # aggregation: the $match is explained inside the first $cursor stage
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    return (planner or {}).get("winningPlan", {})
+
+
+def explain_shape(collection, kind, query, sort_field=None, anchor=None):
+    if kind == "page":
+        if anchor is not None:
+            from bson import ObjectId
+
+            query = keyset_filter(query, sort_field, dict(anchor, _id=ObjectId(anchor["_id"])), True)
+        explain = collection.find(query, {"_id": 1}).sort(sort_spec(sort_field, False)).limit(200).explain()
+    else:
+        group = {"_id": 1, "n": {"$sum": 1}} if kind == "count" else {"_id": "$category", "total": {"$sum": "$amount"}}
+        pipeline = [{"$match": query}, {"$group": group}]
+        explain = collection.database.command("aggregate", collection.name, pipeline=pipeline, explain=True)
+    stages = _stages(_winning_plan(explain))
+    return {
+        "indexes": sorted({idx for _, idx in stages if idx}),
+        "collscan": any(name == "COLLSCAN" for name, _ in stages),
+        "in_memory_sort": any(name == "SORT" for name, _ in stages),
+    }
+
+
+def explain_report(collection, explain=explain_shape):
+    """Explain every query shape; a shape is OK when it neither scans the collection nor sorts in memory.
+
+    `explain(target, kind, query, sort_field, anchor)` defaults to the Mongo
+    planner; the SQLite backend passes its own.
+    """
+    report = []
+    for name, kind, query, sort_field, anchor in query_shapes():
+        res = explain(collection, kind, query, sort_field, anchor)
+        res["name"] = name
+        res["ok"] = not res["collscan"] and not (kind == "page" and res["in_memory_sort"])
+        report.append(res)
+    return report
+
+
+def format_report(report):
+    lines = []
+    for r in report:
+        status = "OK  " if r["ok"] else "SLOW"
+        detail = ", ".join(r["indexes"]) or "no index"
+        if r["collscan"]:
+            detail += ", COLLSCAN"
+        if r["in_memory_sort"]:
+            detail += ", in-memory sort"
+        lines.append(f"{status} {r['name']:<28} {detail}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ensure indexes and check query plans for the expenses collection.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="expense_db")
+    parser.add_argument("--collection", default="expenses")
+    parser.add_argument("--no-create", action="store_true", help="only report, do not create missing indexes")
+    args = parser.parse_args(argv)
+
+    import pymongo
+
+    collection = pymongo.MongoClient(args.uri)[args.db][args.collection]
+    if not args.no_create:
+        ensure_indexes(collection)
+    report = explain_report(collection)
+    print(format_report(report))
+    return 0 if all(r["ok"] for r in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import argparse
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from bson import ObjectId, json_util
+from pymongo.errors import ConnectionFailure
+
+from storage import StorageBackend
+
+# --------------------------
+# Offline write-behind journal
+# --------------------------
+# JournaledStorage puts a local SQLite log in front of the MongoDB backend.
+# Adds, edits and deletes are appended to the log (one fsync'd transaction)
+# and acknowledged straight away, so data entry does not wait on the network
+# and nothing is lost when the server is slow, unreachable, or the app is
+# closed first. A syncer thread drains the log oldest-first through
+# MongoStorage.write_batch, one bulk_write per batch. Inserts get their
+# ObjectId here, on the client, and every batch goes out under an id made of
+# this journal's id and its sequence range. A batch whose acknowledgement was
+# lost is re-sent with the same writes under the same id, which makes the
+# replay a no-op for the expenses and the rollups alike. Reads flush the log
+# before asking the server, so they see our own writes, but never wait on a
+# server that is down: while the syncer is backing off, or when the flush
+# itself cannot connect, they go to the server as it is (the app keeps its
+# own writes on screen from its in-memory copy meanwhile).
+
+SYNC_BATCH = 500  # journaled writes per bulk_write
+RETRY_MIN = 1.0  # seconds before retrying an unreachable server, doubled up to RETRY_MAX
+RETRY_MAX = 60.0
+IDLE_WAKE = 5.0  # the syncer also checks the log this often when nothing woke it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    op      TEXT NOT NULL,
+    args    TEXT NOT NULL,
+    created REAL NOT NULL
+);
+-- writes the server rejected for good (not connection errors); kept for inspection
+CREATE TABLE IF NOT EXISTS journal_failed (
+    seq     INTEGER PRIMARY KEY,
+    op      TEXT NOT NULL,
+    args    TEXT NOT NULL,
+    created REAL NOT NULL,
+    error   TEXT NOT NULL
+);
+-- 'id': this journal's id; 'inflight': "first-last" seq range of the batch being sent
+CREATE TABLE IF NOT EXISTS journal_info (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL
+);
+"""
+
+
+class JournaledStorage(StorageBackend):
+    """A MongoStorage whose writes go through a local journal file first.
+
+    Write methods return as soon as the journal is on disk: `insert`
+    returns the new ObjectId, `delete` / `update_many` by ids return the
+    number of ids, by query None (the count is only known once synced).
+    Statement imports need the server's duplicate check and are flushed
+    and sent directly.
+    """
+
+    def __init__(self, remote, path, batch_size=SYNC_BATCH):
+        super().__init__()
+        self.remote = remote
+        self.name = remote.name
+        self.path = path
+        self.batch_size = batch_size
+        self.last_error = None  # last connection error seen by the syncer
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = FULL")  # an acknowledged write survives a power cut
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()  # the connection
+        self._conn.execute("INSERT OR IGNORE INTO journal_info VALUES ('id', ?)", (uuid.uuid4().hex,))
+        self.journal_id = self._info("id")
+        self._sync_lock = threading.Lock()  # one sync at a time (syncer thread or a flushing read)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal-sync", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _oid(_id):
+        return ObjectId(_id) if isinstance(_id, str) and ObjectId.is_valid(_id) else _id
+
+    # --------------------------
+    # Journal
+    # --------------------------
+    def _append(self, ops):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("INSERT INTO journal (op, args, created) VALUES (?, ?, ?)",
+                                       [(op, json_util.dumps(args), now) for op, args in ops])
+        self._wake.set()
+
+    def _read(self, limit):
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, op, args, created FROM journal ORDER BY seq LIMIT ?",
+                                      (limit,)).fetchall()
+        return [(seq, op, json_util.loads(args), created) for seq, op, args, created in rows]
+
+    def _info(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM journal_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _inflight(self):
+        # the batch a previous sync sent without hearing back: it is re-sent exactly as it was
+        bounds = self._info("inflight")
+        if bounds is None:
+            return []
+        first, last = map(int, bounds.split("-"))
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, op, args, created FROM journal WHERE seq BETWEEN ? AND ? "
+                                      "ORDER BY seq", (first, last)).fetchall()
+        return [(seq, op, json_util.loads(args), created) for seq, op, args, created in rows]
+
+    def _begin(self, batch):
+        bounds = f"{batch[0][0]}-{batch[-1][0]}"
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO journal_info VALUES ('inflight', ?)", (bounds,))
+        return f"{self.journal_id}:{bounds}"
+
+    def _end(self, conn):
+        conn.execute("DELETE FROM journal_info WHERE key = 'inflight'")
+
+    def _remove(self, last_seq):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM journal WHERE seq <= ?", (last_seq,))
+                self._end(self._conn)
+
+    def _reject(self, entry, error):
+        seq, op, args, created = entry
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO journal_failed VALUES (?, ?, ?, ?, ?)",
+                                   (seq, op, json_util.dumps(args), created, f"{type(error).__name__}: {error}"))
+                self._conn.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+                self._end(self._conn)
+
+    def pending(self):
+        """Number of journaled writes not yet on the server."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    def failed(self):
+        """(seq, op, args, error) of writes the server rejected."""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, op, args, error FROM journal_failed ORDER BY seq").fetchall()
+        return [(seq, op, json_util.loads(args), error) for seq, op, args, error in rows]
+
+    # --------------------------
+    # Sync
+    # --------------------------
+    def sync(self):
+        """Send every journaled write to the server, oldest first; returns how many were sent.
+
+        Connection errors propagate and leave the journal as it was; the
+        batch in flight is re-sent first next time. A batch the server
+        rejects for another reason is settled (see MongoStorage.write_batch)
+        and retried one write at a time, and the offending writes are moved
+        to journal_failed, so one bad write cannot block the ones after it.
+        """
+        done = 0
+        with self._sync_lock:
+            while True:
+                batch = self._inflight() or self._read(self.batch_size)
+                if not batch:
+                    return done
+                try:
+                    self._send(batch)
+                except ConnectionFailure:
+                    raise
+                except Exception:
+                    for entry in batch:
+                        try:
+                            self._send([entry])
+                        except ConnectionFailure:
+                            raise
+                        except Exception as e:
+                            self._reject(entry, e)
+                done += len(batch)
+
+    def _send(self, batch):
+        batch_id = self._begin(batch)
+        self.remote.write_batch([(op, args) for _, op, args, _ in batch], batch_id=batch_id)
+        self._remove(batch[-1][0])
+
+    def flush(self):
+        # reads see our own writes: send whatever is still journaled first, unless the server is away
+        if self.last_error is not None or not self.pending():
+            return
+        try:
+            self.sync()
+        except ConnectionFailure as e:
+            self.last_error = e
+
+    def _run(self):
+        delay = RETRY_MIN
+        while not self._stop.is_set():
+            self._wake.clear()  # before syncing, so a write appended meanwhile wakes the next round
+            try:
+                self.sync()
+            except ConnectionFailure as e:
+                self.last_error = e
+                self._stop.wait(delay)
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+            except Exception as e:  # e.g. the journal file itself; keep the thread alive
+                self.last_error = e
+                self._stop.wait(RETRY_MAX)
+                continue
+            self.last_error = None
+            delay = RETRY_MIN
+            self._wake.wait(IDLE_WAKE)
+
+    # --------------------------
+    # StorageBackend: writes are journaled
+    # --------------------------
+    def insert(self, rec):
+        rec["_id"] = self._oid(rec.get("_id")) or ObjectId()
+        self._append([("insert", {"rec": rec})])
+        return rec["_id"]
+
+    def insert_many(self, recs, update_rollups=True):
+        ops = []
+        for rec in recs:
+            rec = dict(rec, _id=self._oid(rec.get("_id")) or ObjectId())
+            ops.append(("insert", {"rec": rec}))
+        if ops:
+            self._append(ops)
+        return len(ops)
+
+    def update(self, _id, old, changes):
+        # the previous values are read back from the server when syncing, not trusted from `old`
+        self._append([("update", {"_id": self._oid(_id), "changes": changes})])
+
+    def delete(self, ids=None, query=None):
+        ids = None if ids is None else [self._oid(i) for i in ids]
+        self._append([("delete", {"ids": ids, "query": query})])
+        return None if ids is None else len(ids)
+
+    def update_many(self, changes, ids=None, query=None):
+        ids = None if ids is None else [self._oid(i) for i in ids]
+        self._append([("update_many", {"changes": changes, "ids": ids, "query": query})])
+        return None if ids is None else len(ids)
+
+    def import_batch(self, recs):
+        self.sync()  # the duplicate check must see every earlier write
+        return self.remote.import_batch(recs)
+
+    # --------------------------
+    # StorageBackend: everything else goes to the server after a flush
+    # --------------------------
+    def ensure_schema(self):
+        self.remote.ensure_schema()
+
+    def explain_report(self):
+        return self.remote.explain_report()
+
+    def verify_rollups(self):
+        self.flush()
+        return self.remote.verify_rollups()
+
+    def rebuild_rollups(self):
+        self.flush()
+        self.remote.rebuild_rollups()
+
+    def count(self, query, limit=None):
+        self.flush()
+        return self.remote.count(query, limit=limit)
+
+    def page(self, query, sort_field="date", descending=False, after=None, before=None, skip=0, limit=None):
+        self.flush()
+        kwargs = {} if limit is None else {"limit": limit}
+        return self.remote.page(query, sort_field, descending, after, before, skip, **kwargs)
+
+    def get(self, _id):
+        self.flush()
+        return self.remote.get(_id)
+
+    def summarize(self, query):
+        self.flush()
+        return self.remote.summarize(query)
+
+    def read_rollups(self, query):
+        self.flush()
+        return self.remote.read_rollups(query)
+
+    def iter_batches(self, query, fields, batch_size):
+        self.flush()
+        return self.remote.iter_batches(query, fields, batch_size)
+
+    def change_token(self):
+        return self.remote.change_token()
+
+    def watch(self, on_change, stop, interval=5.0):
+        self.remote.watch(on_change, stop, interval)
+
+    def close(self):
+        # unsynced writes stay in the journal file and are sent on the next start
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=2.0)
+        with self._lock:
+            self._conn.close()
+        self.remote.close()
+
+
+def main(argv=None):
+    from storage import DEFAULT_URL, open_storage
+
+    parser = argparse.ArgumentParser(description="Show or sync the offline write journal.")
+    parser.add_argument("action", choices=["status", "sync"])
+    parser.add_argument("journal", help="journal file, e.g. expense_journal.db")
+    parser.add_argument("--uri", default=DEFAULT_URL)
+    parser.add_argument("--db", default="expense_db")
+    parser.add_argument("--collection", default="expenses")
+    args = parser.parse_args(argv)
+
+    storage = open_storage(args.uri, args.db, args.collection, journal=args.journal)
+    try:
+        if args.action == "sync":
+            print(f"Synced {storage.sync()} write(s).")
+        print(f"{storage.pending()} write(s) waiting to sync.")
+        rejected = storage.failed()
+        for seq, op, op_args, error in rejected:
+            print(f"rejected #{seq} {op} {json_util.dumps(op_args)}: {error}")
+    finally:
+        storage.close()
+    return 0 if not rejected else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
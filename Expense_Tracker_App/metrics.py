@@ -0,0 +1,343 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+# --------------------------
+# Opt-in instrumentation
+# --------------------------
+# With EXPENSE_TRACKER_METRICS=1 the app times every storage call, every UI
+# handler and every background job into latency histograms, counts the rows
+# they returned, and watches the Tk event loop for stalls. Nothing here is
+# installed (or imported) when instrumentation is off.
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # upper bounds; one more for slower
+STALL_INTERVAL_MS = 50  # heartbeat period on the Tk event loop
+STALL_THRESHOLD_MS = 100  # a heartbeat this late counts as a stall
+RECENT_STALLS = 50
+
+# one cProfile.Profile active at a time: on Python 3.12+ cProfile sits on sys.monitoring,
+# which refuses a second profiler (ValueError) even on another thread
+_profiler = threading.Lock()
+
+# ExpenseTrackerApp methods timed as UI handlers (they run on the Tk thread)
+UI_HANDLERS = ("add_expense", "edit_selected", "apply_edit", "delete_selected", "apply_filters", "clear_filters",
+               "run_search", "sort_by_column", "reload_table", "show_rows", "export_csv", "export_excel",
+               "export_parquet", "import_statement", "show_graphs")
+
+
+class Histogram:
+    """Count / total / max and per-bucket counts of one operation's latency."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def add(self, seconds, rows=None, error=False):
+        ms = seconds * 1000
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.errors += bool(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if rows:
+            self.rows += rows
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket holding the p-th percentile; None past the last bound."""
+        if not self.count:
+            return 0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= p / 100 * self.count:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+        return None
+
+    def as_dict(self):
+        return {"count": self.count, "errors": self.errors, "total_ms": self.total * 1000,
+                "mean_ms": self.total * 1000 / self.count if self.count else 0.0, "max_ms": self.max * 1000,
+                "p50_ms": self.percentile(50), "p95_ms": self.percentile(95), "rows": self.rows,
+                "buckets_ms": dict(zip([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], self.buckets))}
+
+
+def row_count(result):
+    """Rows behind a storage / job result: a list's length, a count, or a summary's count."""
+    if result is None or isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        return result.get("count") if isinstance(result.get("count"), int) else None
+    if isinstance(result, tuple) and result and all(isinstance(x, int) for x in result):
+        return sum(result)  # e.g. import_batch -> (inserted, duplicates)
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+class Metrics:
+    """Thread-safe histograms keyed by (kind, name): kind is storage, ui, job or stall."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.stalls = deque(maxlen=RECENT_STALLS)  # (time, ms, last UI action) of the latest stalls
+        self.last_action = None
+        self.started = time.time()
+        self.capture = None  # ProfileCapture armed for the next UI action
+        self.active_capture = None  # ... and while that action's handler runs (its jobs are profiled too)
+
+    def record(self, kind, name, seconds, rows=None, error=False):
+        with self._lock:
+            hist = self.histograms.get((kind, name))
+            if hist is None:
+                hist = self.histograms[(kind, name)] = Histogram()
+            hist.add(seconds, rows, error)
+
+    def record_job(self, fn, channel, seconds, result=None, error=False):
+        self.record("job", job_name(fn, channel), seconds, row_count(result), error)
+
+    def record_stall(self, seconds):
+        self.record("stall", "event loop", seconds)
+        with self._lock:
+            self.stalls.append((time.time(), seconds * 1000, self.last_action))
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.stalls.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "taken": datetime.now().isoformat(timespec="seconds"),
+                "operations": [dict(kind=k, name=n, **h.as_dict()) for (k, n), h in sorted(self.histograms.items())],
+                "recent_stalls": [{"at": datetime.fromtimestamp(t).isoformat(timespec="seconds"), "ms": ms,
+                                   "after_action": action} for t, ms, action in self.stalls],
+            }
+
+    def format_report(self):
+        snap = self.snapshot()
+        lines = [f"{'kind':<8} {'operation':<24} {'calls':>6} {'err':>4} {'mean':>8} {'p95':>7} {'max':>8} {'rows':>9}"]
+        for op in snap["operations"]:
+            p95 = f"{op['p95_ms']}" if op["p95_ms"] is not None else f">{BUCKETS_MS[-1]}"
+            lines.append(f"{op['kind']:<8} {op['name'][:24]:<24} {op['count']:>6} {op['errors']:>4} "
+                         f"{op['mean_ms']:>8.1f} {p95:>7} {op['max_ms']:>8.1f} {op['rows']:>9}")
+        if snap["recent_stalls"]:
+            lines.append("")
+            lines.append("Recent event-loop stalls:")
+            for s in snap["recent_stalls"][-10:]:
+                lines.append(f"  {s['at']}  {s['ms']:8.1f} ms  after {s['after_action'] or '-'}")
+        lines.append("")
+        lines.append("Times in ms; p95 is the upper bound of its histogram bucket.")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+# --------------------------
+# Wrappers
+# --------------------------
+class InstrumentedStorage:
+    """StorageBackend proxy recording the latency and row count of every call.
+
+    `iter_batches` is timed per batch fetched; `watch` runs for the app's
+    lifetime and is passed through untimed.
+    """
+
+    UNTIMED = ("watch", "close")
+
+    def __init__(self, storage, metrics):
+        self._storage = storage
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._storage, name)
+        if name.startswith("_") or name in self.UNTIMED or not callable(attr):
+            return attr
+        if name == "iter_batches":
+            return self._iter_batches
+        return timed(self._metrics, "storage", name, attr)
+
+    def _iter_batches(self, *args, **kwargs):
+        batches = self._storage.iter_batches(*args, **kwargs)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            self._metrics.record("storage", "iter_batches", time.perf_counter() - start, len(batch))
+            yield batch
+
+
+def timed(metrics, kind, name, fn, count_rows=True):
+    @wraps(fn)
+    def call(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            metrics.record(kind, name, time.perf_counter() - start, error=True)
+            raise
+        metrics.record(kind, name, time.perf_counter() - start, row_count(result) if count_rows else None)
+        return result
+    return call
+
+
+def instrument_handlers(obj, names, metrics):
+    """Replace bound methods of `obj` with timed ones (call before the widgets bind them).
+
+    Handler times include any modal dialog the handler opens. An armed
+    ProfileCapture profiles the next handler call.
+    """
+    for name in names:
+        method = getattr(obj, name)
+
+        def handler(*args, _name=name, _method=method, **kwargs):
+            metrics.last_action = _name
+            capture = metrics.capture
+            if capture is None or metrics.active_capture is not None:
+                return _method(*args, **kwargs)
+            metrics.capture, metrics.active_capture = None, capture
+            try:
+                return capture.run(_name, _method, *args, **kwargs)
+            finally:
+                metrics.active_capture = None
+
+        setattr(obj, name, timed(metrics, "ui", name, wraps(method)(handler), count_rows=False))
+
+
+def job_name(fn, channel=None):
+    """Short name for a background job: its channel, else the method that submitted it."""
+    if channel:
+        return channel
+    qualname = getattr(fn, "__qualname__", "job")
+    return qualname.split(".<locals>")[0].rsplit(".", 1)[-1]
+
+
+# --------------------------
+# Event-loop stalls
+# --------------------------
+class StallMonitor:
+    """Heartbeat on the Tk event loop: a tick that runs late means the loop was busy."""
+
+    def __init__(self, root, metrics, interval_ms=STALL_INTERVAL_MS, threshold_ms=STALL_THRESHOLD_MS):
+        self.root = root
+        self.metrics = metrics
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self._after = None
+        self._expected = None
+
+    def start(self):
+        self._expected = time.perf_counter() + self.interval
+        self._after = self.root.after(int(self.interval * 1000), self._tick)
+
+    def stop(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+
+    def _tick(self):
+        late = time.perf_counter() - self._expected
+        if late >= self.threshold:
+            self.metrics.record_stall(late)
+        self.start()
+
+
+# --------------------------
+# Profiling one action
+# --------------------------
+class ProfileCapture:
+    """cProfile of one UI action: the handler on the Tk thread plus the jobs it submitted.
+
+    `on_done(action, path, text)` is called on the Tk thread once the handler
+    and all of its jobs have finished, with the .prof file written and the
+    top functions by cumulative time as text. Only one profiler can run at a
+    time, so the jobs are profiled one after another once the handler has
+    returned; their latencies are inflated while a capture runs.
+    """
+
+    def __init__(self, on_done, out_dir=None, top=30):
+        self.on_done = on_done
+        self.out_dir = out_dir or tempfile.gettempdir()
+        self.top = top
+        self.action = None
+        self.recording = False
+        self.pending = 0
+        self.profiles = []
+        self._done = False
+
+    def run(self, action, fn, *args, **kwargs):
+        self.action, self.recording = action, True
+        # never wait on the Tk thread: a job of an earlier capture may still hold the profiler
+        profiled = _profiler.acquire(blocking=False)
+        try:
+            if not profiled:
+                return fn(*args, **kwargs)
+            prof = cProfile.Profile()
+            try:
+                return prof.runcall(fn, *args, **kwargs)
+            finally:
+                self.profiles.append(prof)
+        finally:
+            if profiled:
+                _profiler.release()
+            self.recording = False
+            self._maybe_finish()
+
+    def add_job(self):
+        # Tk thread, from BackgroundExecutor.submit
+        self.pending += 1
+
+    def run_job(self, fn, job):
+        # worker thread; waits for the handler's (or another job's) profile to stop first
+        with _profiler:
+            prof = cProfile.Profile()
+            try:
+                return prof.runcall(fn, job)
+            finally:
+                self.profiles.append(prof)  # list.append is atomic
+
+    def job_finished(self):
+        # Tk thread, once the job's callbacks were delivered
+        self.pending -= 1
+        self._maybe_finish()
+
+    def _maybe_finish(self):
+        if self._done or self.recording or self.pending:
+            return
+        self._done = True
+        if not self.profiles:
+            self.on_done(self.action, None, "Nothing was profiled: another profile was still running.")
+            return
+        stats = pstats.Stats(self.profiles[0])
+        for prof in self.profiles[1:]:
+            stats.add(prof)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.out_dir, f"expense_tracker_{self.action}_{stamp}.prof")
+        stats.dump_stats(path)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(self.top)
+        self.on_done(self.action, path, out.getvalue())
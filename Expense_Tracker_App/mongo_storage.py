@@ -0,0 +1,351 @@
+import time
+
+import pymongo
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+import indexes
+import queries
+import rollups
+import search
+from storage import StorageBackend
+
+DUPLICATE_KEY = 11000
+# one counter document per expenses collection, bumped after every write; polled by
+# change_token when change streams are unavailable (a standalone mongod)
+CHANGES_COLLECTION = "expense_changes"
+# rollup deltas of journaled batches, stored before the batch is written (see write_batch)
+BATCHES_COLLECTION = "expense_write_batches"
+# fields a filter may be built on: an update touching one of them may move a row out of a cached result
+FILTER_FIELDS = {"date", "description", search.TERMS_FIELD, search.DESCRIPTION_KEY}
+OWN_EVENT_TTL = 60.0  # seconds a change-stream event for one of our own writes is waited for
+OWN_QUERY_IDS = 10000  # most ids of a delete / bulk edit by query recorded as our own (see _query_ids)
+
+
+# --------------------------
+# MongoDB backend
+# --------------------------
+class MongoStorage(StorageBackend):
+    """Expenses in a MongoDB collection, rollups in expense_rollups next to it."""
+
+    name = "mongo"
+
+    def __init__(self, uri="mongodb://localhost:27017/", db_name="expense_db", collection_name="expenses",
+                 client=None):
+        # `client` replaces the MongoClient for `uri`, e.g. a mongomock.MongoClient in benchmarks
+        super().__init__()
+        self.client = client if client is not None else pymongo.MongoClient(uri)
+        self.db = self.client[db_name]
+        self.collection = self.db[collection_name]
+        self.changes = self.db[CHANGES_COLLECTION]
+        self.batches = self.db[BATCHES_COLLECTION]
+        self._own_ids = {}  # _id -> (change events still expected, monotonic time) of our own writes
+        self._own_pruned = 0.0
+
+    @staticmethod
+    def _oid(_id):
+        # ids coming from another backend (or the UI) as 24-hex strings
+        if isinstance(_id, str) and ObjectId.is_valid(_id):
+            return ObjectId(_id)
+        return _id
+
+    # schema / maintenance
+    def ensure_schema(self):
+        indexes.ensure_indexes(self.collection)
+        rollups.ensure_rollups(self.collection)
+        search.ensure_terms(self.collection)
+
+    def explain_report(self):
+        return indexes.explain_report(self.collection)
+
+    def verify_rollups(self):
+        return rollups.verify(self.collection)
+
+    def rebuild_rollups(self):
+        rollups.rebuild(self.collection)
+        # the rebuilt rollups already count whatever a half-applied batch wrote; its replay
+        # then plans against the current documents instead of the stored deltas
+        self.batches.delete_many({})
+
+    # reads
+    def count(self, query, limit=None):
+        if limit:
+            return self.collection.count_documents(query, limit=limit)
+        return self.collection.count_documents(query)
+
+    def page(self, query, sort_field="date", descending=False, after=None, before=None, skip=0, limit=queries.PAGE_SIZE):
+        return queries.fetch_page(self.collection, query, sort_field, descending, after, before, skip, limit)
+
+    def get(self, _id):
+        return self.collection.find_one({"_id": self._oid(_id)})
+
+    def summarize(self, query):
+        return queries.summarize(self.collection, query)
+
+    def read_rollups(self, query):
+        return rollups.read_rollups(self.collection, query)
+
+    def iter_batches(self, query, fields, batch_size):
+        return queries.iter_batches(self.collection, query, fields, batch_size)
+
+    # writes
+    def insert(self, rec):
+        rec.update(search.description_fields(rec.get("description")))
+        _id = self.collection.insert_one(rec).inserted_id
+        rollups.record_insert(self.collection, [rec])
+        self._touch([_id])
+        return _id
+
+    def insert_many(self, recs, update_rollups=True):
+        recs = [search.with_terms(dict(r, _id=self._oid(r["_id"])) if r.get("_id") is not None else r) for r in recs]
+        if not recs:
+            return 0
+        ids = self.collection.insert_many(recs, ordered=False).inserted_ids
+        if update_rollups:
+            rollups.record_insert(self.collection, recs)
+        self._touch(ids)
+        return len(ids)
+
+    def import_batch(self, recs):
+        if not recs:
+            return 0, 0
+        for r in recs:
+            r.update(search.description_fields(r.get("description")))
+        # unordered: one duplicate does not stop the rest of the batch
+        try:
+            self.collection.insert_many(recs, ordered=False)
+            skipped = set()
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            skipped = {err["index"] for err in errors}
+        inserted = [r for i, r in enumerate(recs) if i not in skipped]
+        rollups.record_insert(self.collection, inserted)
+        if inserted:
+            self._touch([r["_id"] for r in inserted])
+        return len(inserted), len(skipped)
+
+    def update(self, _id, old, changes):
+        if "description" in changes:
+            changes = search.with_terms(changes)
+        self.collection.update_one({"_id": self._oid(_id)}, {"$set": changes})
+        rollups.record_edit(self.collection, old, {**old, **changes})
+        self._touch([self._oid(_id)])
+
+    def delete(self, ids=None, query=None):
+        ids = None if ids is None else [self._oid(i) for i in ids]
+        touched = ids if ids is not None else self._query_ids(query)
+        groups = rollups.affected_groups(self.collection, ids, query)
+        n = queries.delete_expenses(self.collection, ids, query)
+        rollups.record_delete(self.collection, groups)
+        self._touch(touched)
+        return n
+
+    def update_many(self, changes, ids=None, query=None):
+        ids = None if ids is None else [self._oid(i) for i in ids]
+        touched = ids if ids is not None else self._query_ids(query)
+        groups = rollups.affected_groups(self.collection, ids, query)
+        n = queries.update_expenses(self.collection, changes, ids, query)
+        rollups.record_bulk_edit(self.collection, groups, changes)
+        self._touch(touched)
+        return n
+
+    def write_batch(self, ops, batch_id=None):
+        """Apply journaled writes in order; see journal.JournaledStorage.
+
+        Writes addressed by _id go out as one ordered bulk_write, planned
+        against the documents as they are on the server: an insert whose _id
+        already exists, or an edit or delete of a document that is gone, is
+        skipped. Deletes and bulk edits by query run on their own, in
+        sequence. With a `batch_id` (the same one for every retry of the same
+        writes), replaying the batch after a failure anywhere, even halfway
+        through, changes neither the expenses nor the rollups a second time:
+        each run's rollup deltas are worked out once, stored in
+        expense_write_batches before anything is written, and applied with
+        the batch id as a rollup token (see rollups.apply_deltas).
+        """
+        run, n, touched = [], 0, []
+        for op, args in ops:
+            if op in ("delete", "update_many") and args.get("ids") is None:
+                self._write_run(run, batch_id and f"{batch_id}#{n}")
+                touched += self._query_ids(args["query"])
+                self._write_query(op, args, batch_id and f"{batch_id}#{n + 1}")
+                run, n = [], n + 2
+            else:
+                run.append((op, args))
+                touched += self._op_ids(op, args)
+        self._write_run(run, batch_id and f"{batch_id}#{n}")
+        self._touch(touched)
+
+    def _write_once(self, run_id, requests, deltas, write):
+        # requests: [(position of the op in its run, pymongo request)], deltas: one list per op
+        if run_id is not None:
+            stored = self.batches.find_one({"_id": run_id})
+            if stored is None:
+                self.batches.insert_one({"_id": run_id, "deltas": deltas})
+            else:
+                deltas = stored["deltas"]  # planned before the first attempt; the state has moved on since
+        try:
+            write([r for _, r in requests])
+        except BulkWriteError as e:
+            # settled, not lost: the ops before the failing one were applied, the rest were not
+            failed = requests[e.details["writeErrors"][0]["index"]][0]
+            rollups.apply_deltas(self.collection, [d for op in deltas[:failed] for d in op], token=run_id)
+            if run_id is not None:
+                self.batches.delete_one({"_id": run_id})
+            raise
+        except ConnectionFailure:
+            raise  # unknown how far it got: the stored deltas wait for the replay
+        except Exception:
+            if run_id is not None:
+                self.batches.delete_one({"_id": run_id})  # rejected before anything was written
+            raise
+        rollups.apply_deltas(self.collection, [d for op in deltas for d in op], token=run_id)
+        if run_id is not None:
+            self.batches.delete_one({"_id": run_id})
+
+    def _write_query(self, op, args, run_id):
+        # planned like MongoStorage.delete / update_many; both writes are idempotent on their own
+        query, changes = args["query"], args.get("changes")
+        groups = rollups.affected_groups(self.collection, query=query)
+        deltas = [(d, c, -amt, -n) for d, c, amt, n in groups]
+        if op == "delete":
+            write = lambda requests: queries.delete_expenses(self.collection, query=query)
+        else:
+            deltas += [(changes.get("date", d), changes.get("category", c), amt, n) for d, c, amt, n in groups]
+            write = lambda requests: queries.update_expenses(self.collection, changes, query=query)
+        self._write_once(run_id, [], [deltas], write)
+
+    def _write_run(self, ops, run_id):
+        if not ops:
+            return
+        ids = set()
+        for op, args in ops:
+            ids.update(self._op_ids(op, args))
+        state = {}
+        for chunk in queries._chunks(list(ids)):
+            for doc in self.collection.find({"_id": {"$in": chunk}}, {"date": 1, "category": 1, "amount": 1}):
+                state[doc["_id"]] = doc
+
+        requests, deltas = [], []
+        for pos, (op, args) in enumerate(ops):
+            op_deltas = []
+            if op == "insert":
+                rec = args["rec"]
+                if rec["_id"] not in state:
+                    requests.append((pos, InsertOne(search.with_terms(rec))))
+                    state[rec["_id"]] = rec
+                    op_deltas += rollups.row_deltas(rec)
+            elif op == "update":
+                old = state.get(args["_id"])
+                if old is not None:
+                    changes = args["changes"]
+                    requests.append((pos, UpdateOne({"_id": args["_id"]}, {
+                        "$set": search.with_terms(changes) if "description" in changes else changes})))
+                    state[args["_id"]] = new = {**old, **changes}
+                    op_deltas += rollups.row_deltas(old, -1) + rollups.row_deltas(new)
+            else:
+                hit = [i for i in args["ids"] if i in state]
+                for chunk in queries._chunks(hit):
+                    if op == "delete":
+                        requests.append((pos, DeleteMany({"_id": {"$in": chunk}})))
+                    else:
+                        requests.append((pos, UpdateMany({"_id": {"$in": chunk}}, {"$set": args["changes"]})))
+                for i in hit:
+                    old = state.pop(i)
+                    op_deltas += rollups.row_deltas(old, -1)
+                    if op == "update_many":
+                        state[i] = new = {**old, **args["changes"]}
+                        op_deltas += rollups.row_deltas(new)
+            deltas.append(op_deltas)
+        self._write_once(run_id, requests, deltas,
+                         lambda reqs: reqs and self.collection.bulk_write(reqs, ordered=True))
+
+    # change notification
+    @staticmethod
+    def _op_ids(op, args):
+        if op == "insert":
+            return [args["rec"]["_id"]]
+        if op == "update":
+            return [args["_id"]]
+        return args.get("ids") or []
+
+    def _touch(self, ids=()):
+        # one small $inc per write (dbHash would hash every document under a database lock);
+        # the new version and the written ids are remembered so `watch` skips our own writes
+        doc = self.changes.find_one_and_update({"_id": self.collection.name}, {"$inc": {"version": 1}},
+                                               upsert=True, return_document=ReturnDocument.AFTER)
+        self._own_write(doc["version"])
+        now = time.monotonic()
+        with self._own_lock:
+            for _id in ids:
+                pending, _ = self._own_ids.get(_id, (0, now))
+                self._own_ids[_id] = (pending + 1, now)
+
+    def _query_ids(self, query):
+        # the documents a write by query is about to change, so their events are known as ours;
+        # a larger write is not recorded and reaches `watch` like another client's would
+        ids = [d["_id"] for d in self.collection.find(query, {"_id": 1}).limit(OWN_QUERY_IDS + 1)]
+        return ids if len(ids) <= OWN_QUERY_IDS else []
+
+    def _own_event(self, change):
+        # a change-stream event for one of our writes; ids whose event never came (a no-op update) expire
+        _id = change.get("documentKey", {}).get("_id")
+        now = time.monotonic()
+        with self._own_lock:
+            if now - self._own_pruned > 1.0:
+                self._own_ids = {k: v for k, v in self._own_ids.items() if now - v[1] < OWN_EVENT_TTL}
+                self._own_pruned = now
+            pending, at = self._own_ids.get(_id, (0, now))
+            if not pending:
+                return False
+            if pending > 1:
+                self._own_ids[_id] = (pending - 1, at)
+            else:
+                del self._own_ids[_id]
+            return True
+
+    def change_token(self):
+        # only used when change streams are unavailable; sees the writes made through MongoStorage
+        doc = self.changes.find_one({"_id": self.collection.name})
+        return doc["version"] if doc else 0
+
+    @staticmethod
+    def _changed_row(change):
+        # the document is only enough when its old version matched the same filters: inserts,
+        # and updates that touched none of the fields filters are built on (date, and the
+        # description through its search terms)
+        op = change["operationType"]
+        doc = change.get("fullDocument")
+        if op == "insert":
+            return doc
+        if op == "update" and doc is not None:
+            desc = change.get("updateDescription", {})
+            touched = {f.split(".")[0] for f in [*desc.get("updatedFields", {}), *desc.get("removedFields", [])]}
+            if not touched & FILTER_FIELDS:
+                return doc
+        return None
+
+    def watch(self, on_change, stop, interval=5.0):
+        try:
+            stream = self.collection.watch(full_document="updateLookup", max_await_time_ms=int(interval * 1000))
+        except PyMongoError:
+            # change streams need a replica set or sharded cluster; nothing was missed yet
+            if not stop.is_set():
+                super().watch(on_change, stop, interval)
+            return
+        try:
+            with stream:
+                while not stop.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is not None and not self._own_event(change):
+                        on_change(self._changed_row(change))
+        except PyMongoError:
+            if not stop.is_set():
+                on_change(None)  # the open stream broke: events may have been missed
+                super().watch(on_change, stop, interval)
+
+    def close(self):
+        self.client.close()
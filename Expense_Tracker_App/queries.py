@@ -0,0 +1,409 @@
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+from search import DESCRIPTION_KEY, TERMS_FIELD, description_terms, search_terms
+
+# --------------------------
+# Shared query helpers
+# --------------------------
+# Nothing in this module touches tkinter, so the same queries can be reused by
+# the table, the charts and the exports. Filters are expressed as Mongo query
+# documents (see build_query); the functions taking a `collection` are the
+# Mongo implementation behind mongo_storage.MongoStorage, and import pymongo
+# when called so the GUI and the SQLite backend start without loading it.
+
+CATEGORIES = ["Food", "Transport", "Housing", "Bills", "Clothing", "Health", "Education", "Entertainment", "Travel", "Other"]
+
+# fields the table can be sorted on; every sort is made unique with _id as tie-breaker
+SORT_FIELDS = ("date", "description", "amount", "category")
+# stored field each one sorts by, where it is not the field itself: descriptions sort case-insensitively
+SORT_KEYS = {"description": DESCRIPTION_KEY}
+ROW_PROJECTION = {"description": 1, "amount": 1, "category": 1, "date": 1}
+
+PAGE_SIZE = 200
+# ids per $in list; keeps each bulk op far below the 16MB BSON limit
+BULK_CHUNK = 10000
+
+
+def build_query(date_from="", date_to="", search=""):
+    """Mongo filter for an inclusive YYYY-MM-DD date range (either end optional),
+    narrowed to descriptions containing words starting with every word of `search`.
+    """
+    query = {}
+    terms = search_terms(search)
+    if terms:
+        query[TERMS_FIELD] = {"$all": terms}
+    if date_from:
+        query.setdefault("date", {})["$gte"] = date_from
+    if date_to:
+        query.setdefault("date", {})["$lte"] = date_to
+    return query
+
+
+# --------------------------
+# Validation
+# --------------------------
+@lru_cache(maxsize=4096)
+def is_iso_date(date_str):
+    # memoized: an import validates the same few hundred dates over and over
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def validate_expense(desc, amount_text, category, date_str):
+    """(ok, message) for one expense as typed in the form or read by the importer."""
+    if not desc:
+        return False, "Description required."
+    if not amount_text:
+        return False, "Amount required."
+    try:
+        amt = float(amount_text)
+        if amt <= 0:
+            return False, "Amount must be > 0."
+    except ValueError:
+        return False, "Amount must be a number."
+    if category not in CATEGORIES:
+        return False, "Please select a category."
+    if not is_iso_date(date_str):
+        return False, "Date must be YYYY-MM-DD."
+    return True, ""
+
+
+# --------------------------
+# Summary aggregation
+# --------------------------
+def row_matches(query, row):
+    """Whether `row` satisfies `query`, evaluated locally.
+
+    Only understands the plain equality / range filters built by this module;
+    returns None for anything else so callers fall back to asking the server.
+    """
+    ops = {"$gte": lambda a, b: a >= b, "$gt": lambda a, b: a > b,
+           "$lte": lambda a, b: a <= b, "$lt": lambda a, b: a < b}
+    for field, cond in query.items():
+        if field.startswith("$"):
+            return None
+        if field == TERMS_FIELD:
+            # always from the description: a stored copy may predate an edit
+            if not isinstance(cond, dict) or set(cond) != {"$all"}:
+                return None
+            if not set(cond["$all"]) <= set(description_terms(row.get("description"))):
+                return False
+            continue
+        value = row.get(field)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, bound in cond.items():
+            if op not in ops:
+                return None
+            if value is None or not ops[op](value, bound):
+                return False
+    return True
+
+
+def summarize(collection, query):
+    """Total, count, min, max and per-category subtotals for `query`.
+
+    Everything is computed by a $group on the server; only one small document
+    per category comes back, however many expenses match.
+    """
+    return summary_from_groups(collection.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": "$category",
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "min": {"$min": "$amount"},
+            "max": {"$max": "$amount"},
+        }},
+    ]))
+
+
+def summary_from_groups(groups):
+    """Fold per-category {_id, total, count, min, max} groups into one summary dict."""
+    summary = {"total": 0.0, "count": 0, "min": None, "max": None, "by_category": {}}
+    for g in groups:
+        cat = g["_id"] if g["_id"] is not None else ""
+        summary["by_category"][cat] = {"total": float(g["total"]), "count": g["count"]}
+        summary["total"] += float(g["total"])
+        summary["count"] += g["count"]
+        if g["min"] is not None and (summary["min"] is None or g["min"] < summary["min"]):
+            summary["min"] = float(g["min"])
+        if g["max"] is not None and (summary["max"] is None or g["max"] > summary["max"]):
+            summary["max"] = float(g["max"])
+    return summary
+
+
+def _add_to_summary(summary, category, amount, count):
+    cat = summary["by_category"].setdefault(category, {"total": 0.0, "count": 0})
+    cat["total"] += amount
+    cat["count"] += count
+    if not cat["count"]:
+        del summary["by_category"][category]
+    summary["total"] += amount
+    summary["count"] += count
+
+
+def patch_summary(summary, old_row, new_row=None):
+    """Adjust `summary` in place for one edited (or removed, when new_row is None) row.
+
+    Returns False when min/max can no longer be known without re-running
+    the aggregation (the old amount was an extreme and moved inwards).
+    """
+    old_amt = float(old_row.get("amount", 0.0))
+    _add_to_summary(summary, old_row.get("category", ""), -old_amt, -1)
+    if new_row is None:
+        if not summary["count"]:
+            summary["min"] = summary["max"] = None
+            return True
+        return summary["min"] < old_amt < summary["max"]
+    new_amt = float(new_row.get("amount", 0.0))
+    _add_to_summary(summary, new_row.get("category", ""), new_amt, 1)
+    exact = ((old_amt != summary["min"] or new_amt <= old_amt) and
+             (old_amt != summary["max"] or new_amt >= old_amt))
+    summary["min"] = min(summary["min"], new_amt)
+    summary["max"] = max(summary["max"], new_amt)
+    return exact
+
+
+def format_summary(summary):
+    # one-line text for the summary bar
+    if not summary["count"]:
+        return "No expenses"
+    avg = summary["total"] / summary["count"]
+    return (f"{summary['count']} item(s) · min {summary['min']:.2f} · "
+            f"max {summary['max']:.2f} · avg {avg:.2f}")
+
+
+def format_categories(summary):
+    cats = sorted(summary["by_category"].items(), key=lambda kv: kv[1]["total"], reverse=True)
+    return "   ".join(f"{cat or '?'}: {v['total']:.2f}" for cat, v in cats)
+
+
+# --------------------------
+# Bulk writes
+# --------------------------
+def _chunks(ids):
+    ids = list(ids)
+    return [ids[i:i + BULK_CHUNK] for i in range(0, len(ids), BULK_CHUNK)]
+
+
+def delete_expenses(collection, ids=None, query=None):
+    """Delete the given _ids, or every expense matching `query`.
+
+    All chunks go out in a single unordered bulk_write. Returns the number of
+    deleted documents.
+    """
+    from pymongo import DeleteMany
+
+    if query is not None:
+        return collection.delete_many(query).deleted_count
+    ops = [DeleteMany({"_id": {"$in": chunk}}) for chunk in _chunks(ids)]
+    return collection.bulk_write(ops, ordered=False).deleted_count if ops else 0
+
+
+def update_expenses(collection, changes, ids=None, query=None):
+    """$set `changes` on the given _ids (or on everything matching `query`)."""
+    from pymongo import UpdateMany
+
+    if query is not None:
+        return collection.update_many(query, {"$set": changes}).modified_count
+    ops = [UpdateMany({"_id": {"$in": chunk}}, {"$set": changes}) for chunk in _chunks(ids)]
+    return collection.bulk_write(ops, ordered=False).modified_count if ops else 0
+
+
+# --------------------------
+# Keyset paging
+# --------------------------
+def sort_spec(sort_field, descending):
+    direction = -1 if descending else 1  # pymongo.DESCENDING / pymongo.ASCENDING
+    return [(SORT_KEYS.get(sort_field, sort_field), direction), ("_id", direction)]
+
+
+def sort_value(row, sort_field):
+    """The value `row` sorts by on `sort_field` (see SORT_KEYS)."""
+    if sort_field == "description":
+        return (row.get("description") or "").lower()
+    return row.get(sort_field)
+
+
+def keyset_filter(query, sort_field, row, forward):
+    # rows strictly after (forward) or before (backward) `row` in (sort_field, _id) order
+    # the outer bound lets the planner start the (sort_field, _id) index scan at `row`
+    op = "$gt" if forward else "$lt"
+    field, key = SORT_KEYS.get(sort_field, sort_field), sort_value(row, sort_field)
+    cond = {field: {op + "e": key}, "$or": [{field: {op: key}}, {"_id": {op: row["_id"]}}]}
+    return {"$and": [query, cond]} if query else cond
+
+
+def fetch_page(collection, query, sort_field="date", descending=False,
+               after=None, before=None, skip=0, limit=PAGE_SIZE):
+    """One page of rows in (sort_field, _id) order.
+
+    `after` / `before` are rows from a previous page; the page continues from
+    that row using a keyset condition instead of a skip, so the cost of
+    fetching stays the same however deep into the result the user scrolls.
+    """
+    if sort_field not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort on {sort_field!r}")
+    if before is not None:
+        # walk backwards with the sort reversed, then flip the page back
+        cur = collection.find(keyset_filter(query, sort_field, before, descending), ROW_PROJECTION)
+        cur = cur.sort(sort_spec(sort_field, not descending)).limit(limit)
+        return list(cur)[::-1]
+    if after is not None:
+        query = keyset_filter(query, sort_field, after, not descending)
+    cur = collection.find(query, ROW_PROJECTION).sort(sort_spec(sort_field, descending))
+    if skip:
+        cur = cur.skip(skip)
+    return list(cur.limit(limit))
+
+
+def iter_batches(collection, query=None, fields=None, batch_size=1000):
+    """Yield lists of up to `batch_size` row tuples (in `fields` order), sorted by date."""
+    projection = {f: 1 for f in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    cursor = collection.find(query or {}, projection).sort(sort_spec("date", False)).batch_size(batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append(tuple(doc.get(f) for f in fields))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class KeysetPager:
+    """Sliding window of rows over a sorted query.
+
+    Only the rows around the current scroll position (at most `max_rows`) are
+    kept in memory. Scrolling next to the cached window extends it one keyset
+    page at a time; a jump elsewhere (dragging the scrollbar) re-seeks from the
+    nearest end of the result.
+
+    `get` may run on a worker thread while the Tk thread polls `cached`. The
+    storage round trips run outside the lock, on a copy of the window that is
+    swapped in afterwards, so `cached` never waits on the network. Rows come
+    from a storage backend (see storage.StorageBackend) through `count` and
+    `page`.
+    """
+
+    def __init__(self, storage, query=None, sort_field="date", descending=False,
+                 page_size=PAGE_SIZE, max_rows=PAGE_SIZE * 4):
+        self.storage = storage
+        self.query = query or {}
+        self.sort_field = sort_field
+        self.descending = descending
+        self.page_size = page_size
+        self.max_rows = max(max_rows, page_size * 2)
+        self.count = storage.count(self.query)
+        self.start = 0
+        self.rows = []
+        self._lock = threading.RLock()  # start / rows / count; never held across a query
+        self._fetch_lock = threading.Lock()  # one `get` at a time
+        self._version = 0  # bumped by patch / invalidate, so a fetch racing them is not swapped in
+
+    @property
+    def end(self):
+        return self.start + len(self.rows)
+
+    def _page(self, **kw):
+        return self.storage.page(self.query, self.sort_field, self.descending, limit=self.page_size, **kw)
+
+    def _seek(self, offset, count):
+        offset = max(0, min(offset, max(count - self.page_size, 0)))
+        tail = count - offset - self.page_size
+        if 0 <= tail < offset:
+            # closer to the end: skip from the other side with the sort reversed
+            rows = self.storage.page(self.query, self.sort_field, not self.descending,
+                                     skip=tail, limit=self.page_size)[::-1]
+        else:
+            rows = self._page(skip=offset)
+        return offset, rows
+
+    def _trim(self, start, rows, keep_from, keep_to):
+        # drop cached rows furthest from the requested range once over budget; returns the new start
+        while len(rows) > self.max_rows:
+            if keep_from - start >= start + len(rows) - keep_to:
+                cut = min(self.page_size, keep_from - start)
+                if cut <= 0:
+                    break
+                del rows[:cut]
+                start += cut
+            else:
+                cut = min(self.page_size, start + len(rows) - keep_to)
+                if cut <= 0:
+                    break
+                del rows[-cut:]
+        return start
+
+    def patch(self, row):
+        """Replace the cached copy of `row` (same _id). False if it is not in the window."""
+        with self._lock:
+            self._version += 1
+            for i, r in enumerate(self.rows):
+                if r["_id"] == row["_id"]:
+                    self.rows[i] = row
+                    return True
+            return False
+
+    def invalidate(self, count_delta=0):
+        """Forget the cached window (a row moved or left the result); it is refetched on next access."""
+        with self._lock:
+            self._version += 1
+            self.count = max(0, self.count + count_delta)
+            self.rows = []
+
+    def cached(self, offset, n):
+        """Like `get`, but None instead of querying when the rows are not in memory."""
+        with self._lock:
+            offset = max(0, min(offset, self.count))
+            stop = min(offset + n, self.count)
+            if offset >= stop:
+                return []
+            if offset < self.start or stop > self.end:
+                return None
+            return self.rows[offset - self.start:stop - self.start]
+
+    def get(self, offset, n):
+        """Rows offset .. offset+n-1 (clipped to the result size)."""
+        with self._fetch_lock:
+            with self._lock:
+                version, start, rows, count = self._version, self.start, list(self.rows), self.count
+            start, rows, count, window = self._get(offset, n, start, rows, count)
+            with self._lock:
+                if version == self._version:
+                    self.start, self.rows, self.count = start, rows, count
+            return window
+
+    def _get(self, offset, n, start, rows, count):
+        offset = max(0, min(offset, count))
+        stop = min(offset + n, count)
+        if offset >= stop:
+            return start, rows, count, []
+        if not rows or offset >= start + len(rows) + self.page_size or stop <= start - self.page_size:
+            start, rows = self._seek(offset, count)
+        while start + len(rows) < stop:
+            page = self._page(after=rows[-1]) if rows else self._page(skip=start + len(rows))
+            if not page:
+                count = start + len(rows)  # rows were removed underneath us
+                stop = min(stop, count)
+                break
+            rows.extend(page)
+        while start > offset:
+            page = self._page(before=rows[0])
+            if not page:
+                start = 0
+                break
+            rows[:0] = page
+            start = max(0, start - len(page))
+        start = self._trim(start, rows, offset, stop)
+        return start, rows, count, rows[offset - start:stop - start]
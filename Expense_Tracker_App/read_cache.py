@@ -0,0 +1,94 @@
+import sys
+import threading
+from collections import OrderedDict
+
+from queries import row_matches
+
+# --------------------------
+# Client-side result cache
+# --------------------------
+# Switching back to a recently used filter / sort reuses its pager (the rows
+# already fetched around the offset) and its summary instead of querying
+# again. Entries are dropped when a write can change their result: the app's
+# own writes pass the rows they touched, other clients' writes arrive through
+# the storage watcher (see storage.StorageBackend.watch).
+
+
+def cache_key(query, sort_field, descending):
+    return repr(sorted(query.items())), sort_field, descending
+
+
+def _row_size(row):
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+
+class QueryCache:
+    """LRU of {key: (pager, summary)} bounded by entry count and estimated bytes.
+
+    Thread-safe: the Tk thread reads and stores entries while the watcher
+    thread invalidates them.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        # bumped on every invalidation, so a load that started before a write cannot store stale rows
+        self.generation = 0
+        self.hits = self.misses = 0
+        self.enabled = True
+        self._lock = threading.Lock()
+
+    def disable(self):
+        """Stop caching, e.g. when other clients' writes can no longer be observed."""
+        with self._lock:
+            self.enabled = False
+            self.generation += 1
+            self.entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, pager, summary, generation):
+        """Store a load result unless something was invalidated since `generation` was read."""
+        with self._lock:
+            if not self.enabled or generation != self.generation:
+                return False
+            self.entries[key] = (pager, summary)
+            self.entries.move_to_end(key)
+            self._evict()
+            return True
+
+    def _size(self, entry):
+        pager, summary = entry
+        with pager._lock:
+            rows = list(pager.rows)
+        return sum(_row_size(r) for r in rows) + sys.getsizeof(summary)
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        # pagers keep growing as their table scrolls, so sizes are measured at eviction time
+        total = sum(self._size(e) for e in self.entries.values())
+        while len(self.entries) > 1 and total > self.max_bytes:
+            _, entry = self.entries.popitem(last=False)
+            total -= self._size(entry)
+
+    def invalidate(self, rows=None):
+        """Drop the entries whose result may contain any of `rows` (old and new versions); all if None."""
+        with self._lock:
+            self.generation += 1
+            if rows is None:
+                self.entries.clear()
+                return
+            for key in list(self.entries):
+                pager, _ = self.entries[key]
+                if any(row_matches(pager.query, r) is not False for r in rows):
+                    del self.entries[key]
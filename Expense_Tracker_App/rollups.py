@@ -0,0 +1,200 @@
+import argparse
+import sys
+
+import pymongo
+from pymongo import DeleteMany, UpdateOne
+
+# --------------------------
+# Daily x category rollups
+# --------------------------
+# One document per (date, category) holding the sum and count of the expenses
+# on that day. Every write to the expenses collection is followed by a $inc on
+# the affected rollups, so charts and summaries read a few hundred rollup
+# documents instead of scanning the whole expense history. Each $inc is atomic
+# on its own document; `verify` / `rebuild` repair any drift left by a crash
+# between the expense write and its rollup update.
+
+ROLLUP_COLLECTION = "expense_rollups"
+TOKENS_KEPT = 50  # replay tokens remembered per rollup document (see apply_deltas)
+
+
+def rollup_collection(collection):
+    return collection.database[ROLLUP_COLLECTION]
+
+
+def ensure_rollups(collection):
+    """Index the rollups and build them once if the collection was never rolled up."""
+    rollups = rollup_collection(collection)
+    rollups.create_index([("date", pymongo.ASCENDING), ("category", pymongo.ASCENDING)])
+    if rollups.estimated_document_count() == 0 and collection.estimated_document_count() > 0:
+        rebuild(collection)
+
+
+def _key(date, category):
+    return f"{date}|{category}"
+
+
+def apply_deltas(collection, deltas, token=None):
+    """$inc the rollups by `deltas`, a list of (date, category, amount, count).
+
+    Sent as one ordered bulk_write; rollups whose count drops to zero are
+    removed by the last op of the same batch. With a `token` (a journaled
+    batch, see MongoStorage.write_batch) each rollup document records the
+    token with its $inc and skips it when the same token comes again, so a
+    replay after a partial failure adds every delta exactly once. Those
+    rollups are kept at count zero instead of removed, or a replay would
+    recreate them without the token; reads and `verify` skip them.
+    """
+    merged = {}
+    for date, category, amount, count in deltas:
+        acc = merged.setdefault((date, category), [0.0, 0])
+        acc[0] += amount
+        acc[1] += count
+    keys = [(d, c) for (d, c), (amt, n) in merged.items() if amt or n]
+    if not keys:
+        return
+    if token is not None:
+        _apply_once(collection, merged, keys, token)
+        return
+    ops = [UpdateOne({"_id": _key(d, c)},
+                     {"$inc": {"total": merged[d, c][0], "count": merged[d, c][1]},
+                      "$setOnInsert": {"date": d, "category": c}},
+                     upsert=True)
+           for d, c in keys]
+    ops.append(DeleteMany({"_id": {"$in": [_key(d, c) for d, c in keys]}, "count": {"$lte": 0}}))
+    rollup_collection(collection).bulk_write(ops, ordered=True)
+
+
+def _apply_once(collection, merged, keys, token):
+    rollups = rollup_collection(collection)
+    rollups.bulk_write([UpdateOne({"_id": _key(d, c)},
+                                  {"$setOnInsert": {"date": d, "category": c, "total": 0.0, "count": 0}},
+                                  upsert=True)
+                        for d, c in keys], ordered=False)
+    rollups.bulk_write([UpdateOne({"_id": _key(d, c), "tokens": {"$ne": token}},
+                                  {"$inc": {"total": merged[d, c][0], "count": merged[d, c][1]},
+                                   "$push": {"tokens": {"$each": [token], "$slice": -TOKENS_KEPT}}})
+                        for d, c in keys], ordered=False)
+
+
+def row_deltas(row, sign=1):
+    return [(row.get("date", ""), row.get("category", ""), sign * float(row.get("amount", 0.0)), sign)]
+
+
+def record_insert(collection, rows):
+    apply_deltas(collection, [d for r in rows for d in row_deltas(r)])
+
+
+def record_edit(collection, old, new):
+    apply_deltas(collection, row_deltas(old, -1) + row_deltas(new))
+
+
+def affected_groups(collection, ids=None, query=None):
+    """(date, category, total, count) of the expenses about to be deleted or bulk edited."""
+    match = query if query is not None else {"_id": {"$in": list(ids)}}
+    return [(g["_id"]["date"], g["_id"]["category"], float(g["total"]), g["count"])
+            for g in collection.aggregate([
+                {"$match": match},
+                {"$group": {"_id": {"date": "$date", "category": "$category"},
+                            "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+            ])]
+
+
+def record_delete(collection, groups):
+    apply_deltas(collection, [(d, c, -amt, -n) for d, c, amt, n in groups])
+
+
+def record_bulk_edit(collection, groups, changes):
+    # only date / category move a group; amounts are never bulk edited
+    deltas = []
+    for d, c, amt, n in groups:
+        deltas.append((d, c, -amt, -n))
+        deltas.append((changes.get("date", d), changes.get("category", c), amt, n))
+    apply_deltas(collection, deltas)
+
+
+# --------------------------
+# Rebuild / verify
+# --------------------------
+def _group_pipeline(query=None):
+    return [
+        {"$match": query or {}},
+        {"$group": {"_id": {"date": "$date", "category": "$category"},
+                    "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        {"$project": {"_id": {"$concat": [{"$ifNull": ["$_id.date", ""]}, "|", {"$ifNull": ["$_id.category", ""]}]},
+                      "date": {"$ifNull": ["$_id.date", ""]}, "category": {"$ifNull": ["$_id.category", ""]},
+                      "total": 1, "count": 1}},
+    ]
+
+
+def rebuild(collection):
+    """Recompute every rollup from the expenses ($out swaps the collection in atomically)."""
+    collection.aggregate(_group_pipeline() + [{"$out": ROLLUP_COLLECTION}])
+    rollup_collection(collection).create_index([("date", pymongo.ASCENDING), ("category", pymongo.ASCENDING)])
+
+
+def verify(collection, tolerance=0.005):
+    """Compare the rollups with a fresh aggregation; returns a list of mismatch descriptions."""
+    expected = {g["_id"]: g for g in collection.aggregate(_group_pipeline())}
+    problems = []
+    for doc in rollup_collection(collection).find():
+        exp = expected.pop(doc["_id"], None)
+        if exp is None and doc["count"] == 0 and abs(doc["total"]) <= tolerance:
+            continue  # emptied by a journaled batch (see apply_deltas)
+        if exp is None:
+            problems.append(f"{doc['_id']}: stale rollup (count {doc['count']})")
+        elif exp["count"] != doc["count"] or abs(exp["total"] - doc["total"]) > tolerance:
+            problems.append(f"{doc['_id']}: rollup {doc['total']:.2f}/{doc['count']} "
+                            f"!= expenses {exp['total']:.2f}/{exp['count']}")
+    for key, exp in expected.items():
+        problems.append(f"{key}: missing rollup ({exp['total']:.2f}/{exp['count']})")
+    return problems
+
+
+# --------------------------
+# Reads
+# --------------------------
+def read_rollups(collection, query=None):
+    """Rollup documents for a filter (see queries.build_query), sorted by date.
+
+    Rollups only know dates and categories; a filter on anything else (a
+    description search) is grouped from the matching expenses instead.
+    """
+    query = query or {}
+    if set(query) - {"date", "category"}:
+        return list(collection.aggregate(_group_pipeline(query) + [
+            {"$project": {"_id": 0}}, {"$sort": {"date": 1, "category": 1}}]))
+    return list(rollup_collection(collection).find({**query, "count": {"$gt": 0}}, {"_id": 0, "tokens": 0})
+                .sort([("date", pymongo.ASCENDING), ("category", pymongo.ASCENDING)]))
+
+
+def totals_by(rows, field):
+    """{date or category: total} from rollup rows."""
+    out = {}
+    for r in rows:
+        out[r[field]] = out.get(r[field], 0.0) + r["total"]
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify or rebuild the expense_rollups collection.")
+    parser.add_argument("action", choices=["verify", "rebuild"])
+    parser.add_argument("--uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db", default="expense_db")
+    parser.add_argument("--collection", default="expenses")
+    args = parser.parse_args(argv)
+
+    collection = pymongo.MongoClient(args.uri)[args.db][args.collection]
+    if args.action == "rebuild":
+        rebuild(collection)
+        print("Rollups rebuilt.")
+        return 0
+    problems = verify(collection)
+    for p in problems:
+        print(p)
+    print("Rollups match the expenses." if not problems else f"{len(problems)} mismatch(es).")
+    return 0 if not problems else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import re
+
+# --------------------------
+# Description search terms
+# --------------------------
+# Every expense stores the word prefixes of its description in `terms`
+# ("Coffee shop" -> co, cof, ..., coffee, sh, sho, shop). A search for
+# "cof sh" is then {"terms": {"$all": ["cof", "sh"]}}: equality lookups in an
+# index (multikey on Mongo, the expense_terms table on SQLite) instead of a
+# regex scan over every description, and it combines with the date range
+# like any other filter.
+
+TERMS_FIELD = "terms"
+# the lower-cased description, stored next to it: the table sorts descriptions case-insensitively
+DESCRIPTION_KEY = "description_lower"
+MIN_TERM = 2  # shorter words are not indexed, and shorter search words are ignored
+MAX_TERM = 15  # longer words are indexed (and searched) by their first MAX_TERM characters
+
+_WORD = re.compile(r"\w+")
+
+
+def description_terms(description):
+    """Sorted word prefixes of a description, as stored in `terms`."""
+    terms = set()
+    for word in _WORD.findall((description or "").lower()):
+        for n in range(MIN_TERM, min(len(word), MAX_TERM) + 1):
+            terms.add(word[:n])
+    return sorted(terms)
+
+
+def search_terms(text):
+    """Terms a search box entry must all match, most selective (longest) first."""
+    words = {w[:MAX_TERM] for w in _WORD.findall((text or "").lower()) if len(w) >= MIN_TERM}
+    return sorted(words, key=lambda w: (-len(w), w))
+
+
+def description_fields(description):
+    """The fields stored alongside a description: its `terms` and its sort key."""
+    return {TERMS_FIELD: description_terms(description), DESCRIPTION_KEY: (description or "").lower()}
+
+
+def with_terms(rec):
+    """`rec` with its `terms` and sort key filled in from the description."""
+    return dict(rec, **description_fields(rec.get("description")))
+
+
+def ensure_terms(collection, batch_size=5000):
+    """Fill in `terms` / the sort key on Mongo documents written before they existed. Returns the number updated."""
+    from pymongo import UpdateOne
+
+    done = 0
+    ops = []
+    missing = {"$or": [{TERMS_FIELD: {"$exists": False}}, {DESCRIPTION_KEY: {"$exists": False}}]}
+    for doc in collection.find(missing, {"description": 1}).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": description_fields(doc.get("description"))}))
+        if len(ops) >= batch_size:
+            done += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        done += collection.bulk_write(ops, ordered=False).modified_count
+    return done
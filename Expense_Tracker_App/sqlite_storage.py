@@ -0,0 +1,456 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from queries import PAGE_SIZE, SORT_FIELDS, summary_from_groups
+from search import TERMS_FIELD, description_terms
+from storage import StorageBackend
+
+# --------------------------
+# Embedded SQLite backend
+# --------------------------
+COLUMNS = ("_id", "description", "amount", "category", "date", "created_at", "import_hash")
+ROW_COLUMNS = ("_id", "description", "amount", "category", "date")
+CHUNK = 500  # ids per IN (...) list, below SQLite's bound-parameter limit
+
+# expense_rollups is kept by triggers in the same transaction as the expense write;
+# expense_terms (description search, see search.py) gets its rows from Python on
+# insert / description edits and follows date edits and deletes by trigger
+SCHEMA_VERSION = 1  # PRAGMA user_version once expense_terms has been filled for existing rows
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    _id TEXT PRIMARY KEY,
+    description TEXT NOT NULL DEFAULT '',
+    amount REAL NOT NULL DEFAULT 0,
+    category TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    created_at TEXT,
+    import_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS expense_rollups (
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (date, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS expense_terms (
+    term TEXT NOT NULL,
+    day TEXT NOT NULL,
+    expense_id TEXT NOT NULL,
+    PRIMARY KEY (term, day, expense_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS expense_terms_expense ON expense_terms (expense_id);
+-- descriptions sort case-insensitively (Mongo keeps a lower-cased copy instead; NOCASE folds ASCII only)
+DROP INDEX IF EXISTS description_id;
+CREATE INDEX IF NOT EXISTS description_nocase_id ON expenses (description COLLATE NOCASE, _id);
+-- bumped inside every write transaction; polled by change_token
+CREATE TABLE IF NOT EXISTS expense_changes (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO expense_changes (id, version) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS expenses_terms_delete AFTER DELETE ON expenses BEGIN
+    DELETE FROM expense_terms WHERE expense_id = OLD._id;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_terms_date AFTER UPDATE OF date ON expenses BEGIN
+    UPDATE expense_terms SET day = NEW.date WHERE expense_id = NEW._id;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO expense_rollups (date, category, total, count) VALUES (NEW.date, NEW.category, NEW.amount, 1)
+        ON CONFLICT (date, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+    UPDATE expense_rollups SET total = total - OLD.amount, count = count - 1
+        WHERE date = OLD.date AND category = OLD.category;
+    DELETE FROM expense_rollups WHERE date = OLD.date AND category = OLD.category AND count <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF amount, category, date ON expenses BEGIN
+    UPDATE expense_rollups SET total = total - OLD.amount, count = count - 1
+        WHERE date = OLD.date AND category = OLD.category;
+    DELETE FROM expense_rollups WHERE date = OLD.date AND category = OLD.category AND count <= 0;
+    INSERT INTO expense_rollups (date, category, total, count) VALUES (NEW.date, NEW.category, NEW.amount, 1)
+        ON CONFLICT (date, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+"""
+
+INSERT_SQL = f"INSERT INTO expenses ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+OPS = {"$gte": ">=", "$gt": ">", "$lte": "<=", "$lt": "<", "$ne": "!="}
+
+
+def new_id():
+    """24 hex chars like an ObjectId: 4-byte timestamp then 8 random bytes."""
+    return f"{int(time.time()):08x}{os.urandom(8).hex()}"
+
+
+def _where(query):
+    """SQL condition and parameters for the Mongo-style filters the app builds."""
+    clauses, params = [], []
+    for field, cond in query.items():
+        if field in ("$and", "$or"):
+            parts = [_where(sub) for sub in cond]
+            joiner = " AND " if field == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            params += [p for _, ps in parts for p in ps]
+        elif field == TERMS_FIELD:
+            if not isinstance(cond, dict) or set(cond) != {"$all"}:
+                raise ValueError(f"Unsupported search filter {cond!r}")
+            for term in cond["$all"]:
+                clauses.append("_id IN (SELECT expense_id FROM expense_terms WHERE term = ?)")
+                params.append(term)
+        elif field not in COLUMNS:
+            raise ValueError(f"Cannot filter on {field!r}")
+        elif isinstance(cond, dict):
+            for op, value in cond.items():
+                if op == "$in":
+                    clauses.append(f"{field} IN ({','.join('?' * len(value))})" if value else "0")
+                    params += [str(v) if field == "_id" else v for v in value]
+                elif op in OPS:
+                    clauses.append(f"{field} {OPS[op]} ?")
+                    params.append(str(value) if field == "_id" else value)
+                else:
+                    raise ValueError(f"Unsupported operator {op!r}")
+        else:
+            clauses.append(f"{field} = ?")
+            params.append(str(cond) if field == "_id" else cond)
+    return (" AND ".join(clauses) or "1"), params
+
+
+def _terms_where(terms, date_cond):
+    """Condition on `expense_terms AS t` for rows matching every search word and a date filter.
+
+    `t` ranges over the first (most selective) word's entries; each other
+    word is a primary-key lookup on the same (day, expense_id).
+    """
+    first, *others = terms
+    clauses, params = ["t.term = ?"], [first]
+    if isinstance(date_cond, dict):
+        clauses += [f"t.day {OPS[op]} ?" for op in date_cond]
+        params += list(date_cond.values())
+    elif date_cond is not None:
+        clauses.append("t.day = ?")
+        params.append(date_cond)
+    for term in others:
+        clauses.append("EXISTS (SELECT 1 FROM expense_terms AS o "
+                       "WHERE o.term = ? AND o.day = t.day AND o.expense_id = t.expense_id)")
+        params.append(term)
+    return " AND ".join(clauses), params
+
+
+def _parse_created(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class SQLiteStorage(StorageBackend):
+    """Expenses in a local SQLite file (WAL mode, no server to run).
+
+    Each thread gets its own connection, so the background executor's
+    readers never wait on the UI's writes. Single-row writes are one short
+    transaction; rollups are maintained by triggers inside it.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self.ensure_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, row):
+        doc = dict(row)
+        if "created_at" in doc:
+            doc["created_at"] = _parse_created(doc["created_at"])
+        return doc
+
+    @staticmethod
+    def _params(rec):
+        created = rec.get("created_at")
+        return (str(rec["_id"]), rec.get("description") or "", float(rec.get("amount") or 0.0),
+                rec.get("category") or "", rec.get("date") or "",
+                created.isoformat() if isinstance(created, datetime) else created, rec.get("import_hash"))
+
+    # --------------------------
+    # Schema / maintenance
+    # --------------------------
+    def ensure_schema(self):
+        from indexes import INDEXES
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # files created before a column was added
+        have = {r["name"] for r in conn.execute("PRAGMA table_info(expenses)")}
+        if "import_hash" not in have:
+            conn.execute("ALTER TABLE expenses ADD COLUMN import_hash TEXT")
+        # same index set as the Mongo backend (indexes.INDEXES); search terms live in expense_terms
+        # and the description sort index is in SCHEMA
+        for name, keys, unique, partial in INDEXES:
+            if not {k for k, _ in keys} <= set(COLUMNS):
+                continue
+            cols = ", ".join(f"{k} {'DESC' if d < 0 else 'ASC'}" for k, d in keys)
+            where = " AND ".join(f"{k} IS NOT NULL" for k in partial or {})
+            conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON expenses ({cols})"
+                         + (f" WHERE {where}" if where else ""))
+        conn.commit()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with conn:
+                conn.execute("DELETE FROM expense_terms")
+                self._write_terms(conn, conn.execute("SELECT _id, description, date FROM expenses"))
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _explain(self, target, kind, query, sort_field=None, anchor=None):
+        if kind == "page":
+            if anchor is not None:
+                anchor = dict(anchor, _id=str(anchor["_id"]))
+            sql, params = self._page_sql(query, sort_field, False, anchor, 0, 200)
+        elif kind == "count":
+            sql, params = self._count_sql(query)
+        else:
+            sql, params = self._summary_sql(query)
+        plan = [r["detail"] for r in self._conn().execute("EXPLAIN QUERY PLAN " + sql, params)]
+        return {
+            "indexes": sorted({m for d in plan for m in re.findall(r"USING (?:COVERING )?INDEX (\w+)", d)}),
+            "collscan": any(re.match(r"SCAN (TABLE )?expenses\b", d) and "INDEX" not in d for d in plan),
+            "in_memory_sort": any("TEMP B-TREE FOR ORDER BY" in d for d in plan),
+        }
+
+    def explain_report(self):
+        import indexes
+
+        return indexes.explain_report(self, explain=self._explain)
+
+    def rebuild_rollups(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM expense_rollups")
+            conn.execute("INSERT INTO expense_rollups (date, category, total, count) "
+                         "SELECT date, category, SUM(amount), COUNT(*) FROM expenses GROUP BY date, category")
+
+    def verify_rollups(self, tolerance=0.005):
+        conn = self._conn()
+        expected = {(r["date"], r["category"]): (r["total"], r["count"]) for r in conn.execute(
+            "SELECT date, category, SUM(amount) AS total, COUNT(*) AS count FROM expenses GROUP BY date, category")}
+        problems = []
+        for r in conn.execute("SELECT date, category, total, count FROM expense_rollups"):
+            key = (r["date"], r["category"])
+            exp = expected.pop(key, None)
+            if exp is None:
+                problems.append(f"{key[0]}|{key[1]}: stale rollup (count {r['count']})")
+            elif exp[1] != r["count"] or abs(exp[0] - r["total"]) > tolerance:
+                problems.append(f"{key[0]}|{key[1]}: rollup {r['total']:.2f}/{r['count']} "
+                                f"!= expenses {exp[0]:.2f}/{exp[1]}")
+        for key, exp in expected.items():
+            problems.append(f"{key[0]}|{key[1]}: missing rollup ({exp[0]:.2f}/{exp[1]})")
+        return problems
+
+    # --------------------------
+    # Reads
+    # --------------------------
+    def _count_sql(self, query, limit=None):
+        terms = query.get(TERMS_FIELD, {}).get("$all", [])
+        if terms and set(query) <= {TERMS_FIELD, "date"}:
+            # search words (+ date range) are counted from the term index alone
+            where, params = _terms_where(terms, query.get("date"))
+            sql = f"SELECT 1 FROM expense_terms AS t WHERE {where}"
+            if limit:
+                return f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", params + [limit]
+            return f"SELECT COUNT(*) FROM ({sql})", params
+        where, params = _where(query)
+        if limit:
+            return f"SELECT COUNT(*) FROM (SELECT 1 FROM expenses WHERE {where} LIMIT ?)", params + [limit]
+        return f"SELECT COUNT(*) FROM expenses WHERE {where}", params
+
+    def _summary_sql(self, query):
+        where, params = _where(query)
+        return (f"SELECT category AS _id, SUM(amount) AS total, COUNT(*) AS count, MIN(amount) AS min, "
+                f"MAX(amount) AS max FROM expenses WHERE {where} GROUP BY category"), params
+
+    def _page_sql(self, query, sort_field, descending, after, skip, limit):
+        if sort_field not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort on {sort_field!r}")
+        direction = "DESC" if descending else "ASC"
+        if sort_field == "date" and TERMS_FIELD in query:
+            return self._search_page_sql(query, direction, after, skip, limit)
+        where, params = _where(query)
+        key = "description COLLATE NOCASE" if sort_field == "description" else sort_field
+        if after is not None:
+            # row-value comparison walks the (sort_field, _id) index from the anchor
+            where += f" AND ({key}, _id) {'<' if descending else '>'} (?, ?)"
+            params += [after.get(sort_field), str(after["_id"])]
+        sql = (f"SELECT {', '.join(ROW_COLUMNS)} FROM expenses WHERE {where} "
+               f"ORDER BY {key} {direction}, _id {direction} LIMIT ? OFFSET ?")
+        return sql, params + [limit, skip]
+
+    def _search_page_sql(self, query, direction, after, skip, limit):
+        # walk the most selective search word's (term, day, expense_id) key in date order and
+        # join each hit to its expense; the other words and filters are checked on the way
+        terms_where, terms_params = _terms_where(query[TERMS_FIELD]["$all"], query.get("date"))
+        where, params = _where({k: v for k, v in query.items() if k != TERMS_FIELD})
+        sql = (f"SELECT {', '.join(ROW_COLUMNS)} FROM expense_terms AS t JOIN expenses ON expenses._id = t.expense_id "
+               f"WHERE {terms_where} AND {where}")
+        params = terms_params + params
+        if after is not None:
+            sql += f" AND (t.day, t.expense_id) {'<' if direction == 'DESC' else '>'} (?, ?)"
+            params += [after.get("date"), str(after["_id"])]
+        sql += f" ORDER BY t.day {direction}, t.expense_id {direction} LIMIT ? OFFSET ?"
+        return sql, params + [limit, skip]
+
+    def count(self, query, limit=None):
+        sql, params = self._count_sql(query, limit)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def page(self, query, sort_field="date", descending=False, after=None, before=None, skip=0, limit=PAGE_SIZE):
+        if before is not None:
+            # the page before a row is the page after it in the reversed order
+            return self.page(query, sort_field, not descending, after=before, limit=limit)[::-1]
+        sql, params = self._page_sql(query, sort_field, descending, after, skip, limit)
+        return [dict(r) for r in self._conn().execute(sql, params)]
+
+    def get(self, _id):
+        row = self._conn().execute("SELECT * FROM expenses WHERE _id = ?", (str(_id),)).fetchone()
+        return self._row(row) if row else None
+
+    def summarize(self, query):
+        sql, params = self._summary_sql(query)
+        return summary_from_groups(dict(r) for r in self._conn().execute(sql, params))
+
+    def read_rollups(self, query):
+        query = query or {}
+        where, params = _where(query)
+        if set(query) - {"date", "category"}:
+            # rollups only know dates and categories (see rollups.read_rollups)
+            sql = (f"SELECT date, category, SUM(amount) AS total, COUNT(*) AS count FROM expenses "
+                   f"WHERE {where} GROUP BY date, category ORDER BY date, category")
+        else:
+            sql = f"SELECT date, category, total, count FROM expense_rollups WHERE {where} ORDER BY date, category"
+        return [dict(r) for r in self._conn().execute(sql, params)]
+
+    def iter_batches(self, query, fields, batch_size):
+        for f in fields:
+            if f not in COLUMNS:
+                raise ValueError(f"Unknown field {f!r}")
+        where, params = _where(query or {})
+        # a dedicated connection: the read transaction stays open while the caller writes the batches
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cur = conn.execute(f"SELECT {', '.join(fields)} FROM expenses WHERE {where} ORDER BY date, _id", params)
+            created = fields.index("created_at") if "created_at" in fields else None
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if created is not None:
+                    rows = [r[:created] + (_parse_created(r[created]),) + r[created + 1:] for r in rows]
+                yield rows
+        finally:
+            conn.close()
+
+    # --------------------------
+    # Writes
+    # --------------------------
+    @staticmethod
+    def _write_terms(conn, rows):
+        # rows: (_id, description, date)
+        conn.executemany("INSERT OR IGNORE INTO expense_terms (term, day, expense_id) VALUES (?, ?, ?)",
+                         ((t, d or "", _id) for _id, desc, d in rows for t in description_terms(desc)))
+
+    @staticmethod
+    def _bump(conn):
+        # the write's change_token, taken in its own transaction
+        conn.execute("UPDATE expense_changes SET version = version + 1")
+        return conn.execute("SELECT version FROM expense_changes").fetchone()[0]
+
+    def insert(self, rec):
+        rec.setdefault("_id", new_id())
+        params = self._params(rec)
+        with self._conn() as conn:
+            conn.execute(INSERT_SQL, params)
+            self._write_terms(conn, [(params[0], params[1], params[4])])
+            version = self._bump(conn)
+        self._own_write(version)
+        return rec["_id"]
+
+    def insert_many(self, recs, update_rollups=True):
+        # the triggers keep the rollups in step either way
+        rows = [self._params(r if r.get("_id") is not None else dict(r, _id=new_id())) for r in recs]
+        with self._conn() as conn:
+            conn.executemany(INSERT_SQL, rows)
+            self._write_terms(conn, [(r[0], r[1], r[4]) for r in rows])
+            version = self._bump(conn)
+        self._own_write(version)
+        return len(rows)
+
+    def import_batch(self, recs):
+        # duplicates of a stored import_hash are skipped by the unique index
+        rows = [self._params(dict(r, _id=r.get("_id") or new_id())) for r in recs]
+        with self._conn() as conn:
+            inserted = conn.executemany(INSERT_SQL.replace("INSERT", "INSERT OR IGNORE", 1), rows).rowcount
+            ids = [r[0] for r in rows]
+            for i in range(0, len(ids), CHUNK):
+                chunk = ids[i:i + CHUNK]
+                # only the rows that were actually inserted get search terms
+                self._write_terms(conn, conn.execute(
+                    f"SELECT _id, description, date FROM expenses WHERE _id IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall())
+            version = self._bump(conn)
+        self._own_write(version)
+        return inserted, len(rows) - inserted
+
+    def update(self, _id, old, changes):
+        sets = ", ".join(f"{k} = ?" for k in changes if k in COLUMNS and k != "_id")
+        with self._conn() as conn:
+            conn.execute(f"UPDATE expenses SET {sets} WHERE _id = ?",
+                         [v for k, v in changes.items() if k in COLUMNS and k != "_id"] + [str(_id)])
+            if "description" in changes:
+                conn.execute("DELETE FROM expense_terms WHERE expense_id = ?", (str(_id),))
+                self._write_terms(conn, conn.execute(
+                    "SELECT _id, description, date FROM expenses WHERE _id = ?", (str(_id),)).fetchall())
+            version = self._bump(conn)
+        self._own_write(version)
+
+    def _by_ids_or_query(self, sql_prefix, prefix_params, ids, query):
+        # one transaction for the whole selection
+        n = 0
+        with self._conn() as conn:
+            if query is not None:
+                where, params = _where(query)
+                n = conn.execute(f"{sql_prefix} WHERE {where}", prefix_params + params).rowcount
+            else:
+                ids = [str(i) for i in ids]
+                for i in range(0, len(ids), CHUNK):
+                    chunk = ids[i:i + CHUNK]
+                    n += conn.execute(f"{sql_prefix} WHERE _id IN ({','.join('?' * len(chunk))})",
+                                      prefix_params + chunk).rowcount
+            version = self._bump(conn)
+        self._own_write(version)
+        return n
+
+    def delete(self, ids=None, query=None):
+        return self._by_ids_or_query("DELETE FROM expenses", [], ids, query)
+
+    def update_many(self, changes, ids=None, query=None):
+        keys = [k for k in changes if k in COLUMNS and k != "_id"]
+        sets = ", ".join(f"{k} = ?" for k in keys)
+        return self._by_ids_or_query(f"UPDATE expenses SET {sets}", [changes[k] for k in keys], ids, query)
+
+    def change_token(self):
+        # a counter rather than PRAGMA data_version, so the watcher can tell our own commits apart
+        return self._conn().execute("SELECT version FROM expense_changes").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# --------------------------
+# Cold-start benchmark
+# --------------------------
+# Starts a fresh interpreter per run and times `import app` and, when a display
+# is available, the time until the main window has been drawn. Exits non-zero
+# when the median goes over budget or when importing the app pulls in one of
+# the heavy modules that are meant to load on first use.
+
+IMPORT_BUDGET = 0.35  # seconds, median `import app`
+WINDOW_BUDGET = 1.0  # seconds, median from `import app` to the first drawn window
+HEAVY_MODULES = ("matplotlib", "numpy", "pandas", "pymongo", "openpyxl", "pyarrow")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+out = {"import": t1 - t0,
+       "heavy": sorted({m.split(".")[0] for m in sys.modules} & set(sys.argv[2].split(",")))}
+if sys.argv[1]:
+    root = app.tk.Tk()
+    ui = app.ExpenseTrackerApp(root, mongo_uri=sys.argv[1])
+    root.update()
+    out["window"] = time.perf_counter() - t1
+    ui.on_close()
+print(json.dumps(out))
+"""
+
+
+def has_display():
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def run_once(storage_url=None):
+    """One cold start in a new interpreter; returns {import, heavy, [window], process}."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _CHILD, storage_url or "", ",".join(HEAVY_MODULES)],
+                          cwd=HERE, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - start
+    return result
+
+
+def measure(runs=5, window=None, storage_url=None):
+    """Median timings over `runs` cold starts, plus the heavy modules seen at import."""
+    window = has_display() if window is None else window
+    tmp = None
+    if window and storage_url is None:
+        # an empty embedded database, so the window run needs no MongoDB server
+        tmp = tempfile.TemporaryDirectory()
+        storage_url = "sqlite:///" + os.path.join(tmp.name, "startup.db")
+    try:
+        samples = [run_once(storage_url if window else None) for _ in range(runs)]
+    finally:
+        if tmp:
+            tmp.cleanup()
+    result = {"runs": runs, "heavy": sorted({m for s in samples for m in s["heavy"]})}
+    for field in ("import", "window", "process"):
+        values = [s[field] for s in samples if field in s]
+        if values:
+            result[field] = statistics.median(values)
+    return result
+
+
+def check(result, import_budget=IMPORT_BUDGET, window_budget=WINDOW_BUDGET):
+    """List of budget violations in a `measure` result (empty when within budget)."""
+    problems = []
+    if result["heavy"]:
+        problems.append(f"`import app` loaded {', '.join(result['heavy'])}")
+    if result["import"] > import_budget:
+        problems.append(f"import took {result['import']:.3f}s (budget {import_budget:.3f}s)")
+    if "window" in result and result["window"] > window_budget:
+        problems.append(f"first window took {result['window']:.3f}s (budget {window_budget:.3f}s)")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the app's cold start against a time budget.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--window-budget", type=float, default=WINDOW_BUDGET)
+    parser.add_argument("--no-window", action="store_true", help="only time the import (no display needed)")
+    parser.add_argument("--storage", help="storage URL for the window run (default: an empty SQLite file)")
+    parser.add_argument("--json", help="also write the result to this file")
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs, window=False if args.no_window else None, storage_url=args.storage)
+    print(f"import app      {result['import']:.3f}s (median of {result['runs']})")
+    if "window" in result:
+        print(f"first window    {result['window']:.3f}s")
+    else:
+        print("first window    skipped (no display)")
+    print(f"process total   {result['process']:.3f}s")
+    problems = check(result, args.import_budget, args.window_budget)
+    result["problems"] = problems
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    for p in problems:
+        print("OVER BUDGET:", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import argparse
+import sys
+import threading
+
+# --------------------------
+# Storage backends
+# --------------------------
+# The app, the exports and the batch tools talk to a StorageBackend instead of
+# a pymongo collection, so a deployment can pick its engine: MongoDB
+# (mongo_storage.MongoStorage) or an embedded SQLite file in WAL mode
+# (sqlite_storage.SQLiteStorage). Filters are Mongo-style query documents as
+# built by queries.build_query; every backend understands that subset.
+
+DEFAULT_URL = "mongodb://localhost:27017/"
+MIGRATE_FIELDS = ["_id", "description", "amount", "category", "date", "created_at", "import_hash"]
+
+
+class StorageBackend:
+    """Interface shared by the storage engines.
+
+    Row dicts carry `_id`, description, amount, category and date. `_id`
+    values are opaque to callers: pass back whatever a backend returned.
+    """
+
+    name = "abstract"
+
+    def __init__(self):
+        self._own_tokens = set()  # change_token values produced by this process's writes, see watch
+        self._own_lock = threading.Lock()
+
+    # schema / maintenance
+    def ensure_schema(self):
+        """Create indexes (and rollups) the queries rely on; idempotent."""
+        raise NotImplementedError
+
+    def explain_report(self):
+        """Query-plan report for every query shape, see indexes.explain_report."""
+        raise NotImplementedError
+
+    def verify_rollups(self):
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        raise NotImplementedError
+
+    # reads
+    def count(self, query, limit=None):
+        raise NotImplementedError
+
+    def page(self, query, sort_field="date", descending=False, after=None, before=None, skip=0, limit=200):
+        """One page in (sort_field, _id) order; see queries.fetch_page."""
+        raise NotImplementedError
+
+    def get(self, _id):
+        raise NotImplementedError
+
+    def summarize(self, query):
+        """See queries.summarize."""
+        raise NotImplementedError
+
+    def read_rollups(self, query):
+        """Day x category {date, category, total, count} rows for a date filter."""
+        raise NotImplementedError
+
+    def iter_batches(self, query, fields, batch_size):
+        """Row tuples in `fields` order, sorted by date, `batch_size` at a time."""
+        raise NotImplementedError
+
+    # writes (rollups are kept in step by the backend)
+    def insert(self, rec):
+        """Insert one expense; returns its _id."""
+        raise NotImplementedError
+
+    def insert_many(self, recs, update_rollups=True):
+        """Insert expenses (keeping any `_id` they carry); returns the number inserted."""
+        raise NotImplementedError
+
+    def import_batch(self, recs):
+        """Insert imported expenses, skipping those whose `import_hash` is already stored.
+
+        Returns (inserted, duplicates).
+        """
+        raise NotImplementedError
+
+    def update(self, _id, old, changes):
+        raise NotImplementedError
+
+    def delete(self, ids=None, query=None):
+        raise NotImplementedError
+
+    def update_many(self, changes, ids=None, query=None):
+        raise NotImplementedError
+
+    def write_batch(self, ops, batch_id=None):
+        """Apply journaled (op, args) writes in order; a retry under the same `batch_id` applies them once."""
+        raise NotImplementedError
+
+    # change notification (writes by other clients)
+    def change_token(self):
+        """A value that changes whenever a write is committed; None if the backend cannot tell.
+
+        Counting backends return an int bumped once per write and pass the
+        values of their own writes to `_own_write`.
+        """
+        return None
+
+    def _own_write(self, token):
+        with self._own_lock:
+            self._own_tokens.add(token)
+
+    def _only_own_writes(self, last, token):
+        # every version between two polls came from this process: nothing for the app to reload
+        with self._own_lock:
+            mine = isinstance(token, int) and token > last and all(
+                v in self._own_tokens for v in range(last + 1, token + 1))
+            self._own_tokens = {v for v in self._own_tokens if v > token}
+        return mine
+
+    def watch(self, on_change, stop, interval=5.0):
+        """Call on_change(row) for committed writes until `stop` (a threading.Event) is set.
+
+        Runs on its own thread. `row` is the written document when the backend
+        can tell, else None ("anything may have changed"). Writes made through
+        this backend object are not reported: the app has applied them already.
+        This default polls change_token every `interval` seconds.
+        """
+        last = self.change_token()
+        if last is None:
+            return
+        while not stop.wait(interval):
+            token = self.change_token()
+            if token != last:
+                if not self._only_own_writes(last, token):
+                    on_change(None)
+                last = token
+
+    def close(self):
+        pass
+
+
+def open_storage(url=DEFAULT_URL, db_name="expense_db", collection_name="expenses", journal=None):
+    """Backend for a URL: mongodb://... / mongodb+srv://... or sqlite:///path/to/expenses.db.
+
+    With `journal` (a file path), MongoDB writes go through a local
+    write-behind journal first (see journal.JournaledStorage); the SQLite
+    backend is local already and ignores it.
+    """
+    if url.startswith("sqlite:///"):
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(url[len("sqlite:///"):])
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        from mongo_storage import MongoStorage
+        backend = MongoStorage(url, db_name, collection_name)
+        if journal:
+            from journal import JournaledStorage
+            return JournaledStorage(backend, journal)
+        return backend
+    raise ValueError(f"Unsupported storage URL {url!r}")
+
+
+# --------------------------
+# Migration
+# --------------------------
+def migrate(src, dst, batch_size=5000, progress=None):
+    """Copy every expense from `src` to `dst`, keeping _ids, one batch per write.
+
+    Rows are streamed, so the migration runs in constant memory. Rollups on
+    the target are rebuilt at the end. Returns the number of rows copied.
+    """
+    total = src.count({}) if progress else None
+    done = 0
+    for batch in src.iter_batches({}, MIGRATE_FIELDS, batch_size):
+        dst.insert_many([{f: v for f, v in zip(MIGRATE_FIELDS, row) if v is not None} for row in batch],
+                        update_rollups=False)
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    dst.rebuild_rollups()
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy expenses between storage backends.")
+    parser.add_argument("source", help="e.g. mongodb://localhost:27017/")
+    parser.add_argument("target", help="e.g. sqlite:///expenses.db")
+    parser.add_argument("--db", default="expense_db")
+    parser.add_argument("--collection", default="expenses")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    src = open_storage(args.source, args.db, args.collection)
+    dst = open_storage(args.target, args.db, args.collection)
+    dst.ensure_schema()
+    n = migrate(src, dst, args.batch_size,
+                progress=lambda done, total: print(f"\r{done}/{total}", end="", flush=True))
+    print(f"\nMigrated {n} expense(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
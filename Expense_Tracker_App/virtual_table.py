@@ -0,0 +1,233 @@
+from tkinter import ttk
+
+
+# --------------------------
+# Virtualized Treeview
+# --------------------------
+class VirtualTable:
+    """A ttk.Treeview that only ever holds the rows currently on screen.
+
+    Rows come from a pager (see queries.KeysetPager) exposing `count` and
+    `get(offset, n)`. The scrollbar is driven by the row offset rather than
+    by the Treeview itself, and each scroll re-renders the visible slice.
+    The pager keeps `margin` extra rows on either side so small scrolls are
+    served from memory.
+
+    When a `loader` is given (see worker.BackgroundExecutor.submit), pages
+    that are not cached are fetched through it and the table keeps showing
+    the previous rows until they arrive.
+    """
+
+    def __init__(self, parent, columns, row_values, margin=50, loader=None):
+        self.columns = columns
+        self.row_values = row_values  # row dict -> tuple of column values
+        self.margin = margin
+        self.loader = loader
+        self.pager = None
+        self.offset = 0
+        self.visible = 20
+        self.rows = []
+        self.selected = {}  # _id str -> row dict, survives scrolling
+        self.all_selected = False  # every row of the pager's query, loaded or not
+
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", selectmode="extended")
+        self.vsb = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.vsb.pack(side="right", fill="y")
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Button-1>", self._on_click, add="+")
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible))
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(self.count))
+        self.tree.bind("<Up>", lambda e: self._on_arrow(-1))
+        self.tree.bind("<Down>", lambda e: self._on_arrow(1))
+        self.tree.bind("<Control-a>", self.select_all)
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    @property
+    def count(self):
+        return self.pager.count if self.pager else 0
+
+    # --------------------------
+    # Data source
+    # --------------------------
+    def set_pager(self, pager, keep_offset=False):
+        self.pager = pager
+        if not keep_offset:
+            self.offset = 0
+            self.selected.clear()
+            self.all_selected = False
+        self.render()
+
+    def refresh(self):
+        """Re-render the current position (after the pager was rebuilt or patched)."""
+        self.render()
+
+    # --------------------------
+    # Scrolling
+    # --------------------------
+    def scroll(self, delta):
+        self.scroll_to(self.offset + delta)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.count - self.visible))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(int(float(args[0]) * self.count))
+        elif action == "scroll":
+            step = self.visible if args[1] == "pages" else 1
+            self.scroll(int(args[0]) * step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        step = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.scroll(step * 3)
+        return "break"
+
+    def _on_arrow(self, step):
+        # let the Treeview move the focus inside the window, scroll at its edges
+        focus = self.tree.focus()
+        items = self.tree.get_children()
+        if not items or focus not in items:
+            return None
+        pos = items.index(focus)
+        if (step < 0 and pos > 0) or (step > 0 and pos < len(items) - 1):
+            return None
+        self.scroll(step)
+        items = self.tree.get_children()
+        if items:
+            target = items[0] if step < 0 else items[-1]
+            self.tree.focus(target)
+            self.tree.selection_set(target)
+        return "break"
+
+    def _on_resize(self, event):
+        rowheight = int(ttk.Style(self.tree).lookup("Treeview", "rowheight") or 20)
+        items = self.tree.get_children()
+        bbox = self.tree.bbox(items[0]) if items else None
+        heading = bbox[1] if bbox else rowheight
+        visible = max(1, (event.height - heading) // rowheight)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    # --------------------------
+    # Rendering
+    # --------------------------
+    def window(self):
+        """(start, n) of the rows the pager should hold for the current offset."""
+        start = max(0, self.offset - self.margin)
+        return start, self.offset - start + self.visible + self.margin
+
+    def render(self, fetched=None):
+        if self.pager is None:
+            return
+        self.offset = max(0, min(self.offset, self.count - self.visible))
+        start, n = self.window()
+        window = self.pager.cached(start, n)
+        if window is None and fetched is not None and fetched[0] == (self.pager, start, n):
+            window = fetched[1]
+        if window is None:
+            if self.loader is None:
+                window = self.pager.get(start, n)
+            else:
+                self._fetch(start, n)
+                self._update_scrollbar()
+                return
+        self.rows = window[self.offset - start:self.offset - start + self.visible]
+
+        self.tree.delete(*self.tree.get_children())
+        for i, r in enumerate(self.rows):
+            tag = "even" if (self.offset + i) % 2 == 0 else "odd"
+            self.tree.insert("", "end", iid=str(r["_id"]), values=self.row_values(r), tags=(tag,))
+        if self.all_selected:
+            keep = list(self.tree.get_children())
+        else:
+            keep = [iid for iid in self.selected if self.tree.exists(iid)]
+        if keep:
+            self.tree.selection_set(keep)
+        self._update_scrollbar()
+
+    def update_row(self, row):
+        """Redraw one row in place if it is on screen; no other item is touched."""
+        iid = str(row["_id"])
+        for i, r in enumerate(self.rows):
+            if str(r["_id"]) == iid:
+                self.rows[i] = row
+                break
+        if iid in self.selected:
+            self.selected[iid] = row
+        if self.tree.exists(iid):
+            self.tree.item(iid, values=self.row_values(row))
+
+    def _fetch(self, start, n):
+        pager = self.pager
+        key = (pager, start, n)
+        self.loader(lambda job: pager.get(start, n),
+                    on_done=lambda rows: self.render(fetched=(key, rows)) if self.pager is pager else None,
+                    channel="page")
+
+    def _update_scrollbar(self):
+        if self.count:
+            self.vsb.set(self.offset / self.count, min(1.0, (self.offset + self.visible) / self.count))
+        else:
+            self.vsb.set(0.0, 1.0)
+
+    def _on_click(self, event):
+        # a plain click replaces the selection, including rows scrolled away
+        if not event.state & 0x0005:  # neither Shift nor Control held
+            self.selected.clear()
+            self.all_selected = False
+
+    def _on_select(self, event=None):
+        chosen = set(self.tree.selection())
+        if self.all_selected:
+            if all(str(r["_id"]) in chosen for r in self.rows):
+                return
+            # a row was deselected: fall back to explicit selection of what is on screen
+            self.all_selected = False
+            self.selected.clear()
+        for r in self.rows:
+            iid = str(r["_id"])
+            if iid in chosen:
+                self.selected[iid] = r
+            else:
+                self.selected.pop(iid, None)
+
+    # --------------------------
+    # Selection
+    # --------------------------
+    def selection(self):
+        """Selected rows, including ones scrolled out of view.
+
+        Not meaningful while `all_selected` is set; callers then act on the
+        pager's query instead.
+        """
+        return list(self.selected.values())
+
+    def selection_count(self):
+        return self.count if self.all_selected else len(self.selected)
+
+    def select_all(self, event=None):
+        self.all_selected = True
+        self.selected.clear()
+        self.render()
+        return "break"
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.all_selected = False
+        self.tree.selection_remove(*self.tree.selection())
@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+
+# --------------------------
+# Background executor
+# --------------------------
+class Cancelled(Exception):
+    """Raised inside a job that noticed it was cancelled."""
+
+
+class Job:
+    """Handle for one piece of background work.
+
+    The function run by the executor receives its Job and can call
+    `job.check()` in long loops and `job.progress(done, total)` to report
+    how far it got.
+    """
+
+    def __init__(self, executor, channel):
+        self._executor = executor
+        self.channel = channel
+        self._cancel = threading.Event()
+        self.capture = None  # metrics.ProfileCapture this job is profiled into
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def progress(self, done, total=None):
+        self._executor._post(self, self._executor._report_progress, self, done, total)
+
+
+class BackgroundExecutor:
+    """Runs Mongo calls on a thread pool and hands results back to the Tk thread.
+
+    Tk is not thread-safe, so workers never touch widgets: results go into a
+    queue that the Tk thread drains with `root.after` while jobs are pending.
+    Submitting on a `channel` cancels whatever was still running on that
+    channel (e.g. a table load superseded by a new filter); results of
+    cancelled jobs are dropped.
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=25, on_status=None, metrics=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_status = on_status  # called with (pending job count, progress fraction or None)
+        self.metrics = metrics  # metrics.Metrics when instrumentation is on
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._results = queue.Queue()
+        self._channels = {}
+        self._pending = set()
+        self._progress = None
+        self._polling = False
+
+    def submit(self, fn, on_done=None, on_error=None, channel=None):
+        job = Job(self, channel)
+        if channel is not None:
+            prev = self._channels.get(channel)
+            if prev is not None:
+                prev.cancel()
+            self._channels[channel] = job
+        if self.metrics is not None and self.metrics.active_capture is not None:
+            job.capture = self.metrics.active_capture
+            job.capture.add_job()
+        self._pending.add(job)
+        self._pool.submit(self._run, job, fn, on_done, on_error)
+        self._notify()
+        self._schedule()
+        return job
+
+    def cancel(self, channel=None):
+        """Cancel the job on `channel`, or every pending job."""
+        jobs = [self._channels.get(channel)] if channel is not None else list(self._pending)
+        for job in jobs:
+            if job is not None:
+                job.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    # --------------------------
+    # Worker side
+    # --------------------------
+    def _run(self, job, fn, on_done, on_error):
+        start = time.perf_counter()
+        try:
+            if job.cancelled:
+                raise Cancelled()
+            result = job.capture.run_job(fn, job) if job.capture is not None else fn(job)
+        except Cancelled:
+            self._post(job, None)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record_job(fn, job.channel, time.perf_counter() - start, error=True)
+            self._post(job, on_error or self._default_error, e)
+        else:
+            if self.metrics is not None:
+                self.metrics.record_job(fn, job.channel, time.perf_counter() - start, result)
+            self._post(job, on_done, result)
+        finally:
+            self._results.put((job, self._finish, (job,)))
+
+    def _post(self, job, callback, *args):
+        if callback is not None:
+            self._results.put((job, callback, args))
+
+    # --------------------------
+    # Tk side
+    # --------------------------
+    def _schedule(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._drain)
+
+    def _drain(self):
+        self._polling = False
+        try:
+            while True:
+                try:
+                    job, callback, args = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if job.cancelled and callback != self._finish:
+                    continue
+                callback(*args)
+        finally:
+            if self._pending:
+                self._schedule()
+
+    def _finish(self, job):
+        if job.capture is not None:
+            job.capture.job_finished()
+        self._pending.discard(job)
+        if self._channels.get(job.channel) is job:
+            del self._channels[job.channel]
+        if not self._pending:
+            self._progress = None
+        self._notify()
+
+    def _report_progress(self, job, done, total):
+        self._progress = (done / total) if total else None
+        self._notify()
+
+    def _notify(self):
+        if self.on_status is not None:
+            self.on_status(len(self._pending), self._progress)
+
+    @staticmethod
+    def _default_error(exc):
+        messagebox.showerror("Database", str(exc))